@@ -2,26 +2,30 @@ import gzip
 import io
 import json
 import os
+import tempfile
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-from catboost import CatBoostRegressor
-from lightgbm import LGBMRegressor
-from scipy import linalg
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.feature_selection import SelectKBest, f_regression
-from sklearn.kernel_ridge import KernelRidge
-from sklearn.linear_model import Ridge, Lasso, BayesianRidge, ElasticNet
 from sklearn.metrics import r2_score, mean_squared_error
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVR
-from xgboost import XGBRegressor
 
+from gs_blup import GBLUPModel, MULTI_TRAIT_MODELS, solve_kernel_traits
+from gs_cv import cross_validate
+from gs_impute import GenotypeImputer
+from gs_kernels import kernel_cache, cross_kernel
+from gs_rkhs import MultiKernelModel, fit_rkhs_traits
+from gs_models import MODEL_ALIASES, create_model
+from gs_precision import as_work, blocked_products
+from gs_screen import MarkerSelector
+from gs_shared import compact_genotypes
+from gs_threads import thread_budget, describe_threads
+from gs_tuning import OPTIMIZATION_METHODS, HyperparameterSearch
 
-def read_vcf(vcf_file, sample_ids=None):
+
+def read_vcf(vcf_file, sample_ids=None, return_markers=False):
     if vcf_file.endswith('.gz'):
         f = gzip.open(vcf_file, 'rt')
     else:
@@ -29,7 +33,12 @@ def read_vcf(vcf_file, sample_ids=None):
 
     lines = [line for line in f if not line.startswith('##')]
     f.close()
+    return parse_vcf_lines(lines, sample_ids, return_markers)
+
 
+def parse_vcf_lines(lines, sample_ids=None, return_markers=False):
+    """解析 VCF 文本行（可以是文件的一部分，需包含 #CHROM 表头行）"""
+    lines = [line for line in lines if not line.startswith('##')]
     vcf_data = pd.read_csv(io.StringIO(''.join(lines)), sep='\t')
     vcf_samples = vcf_data.columns[9:].tolist()
 
@@ -41,24 +50,85 @@ def read_vcf(vcf_file, sample_ids=None):
 
     for sample in vcf_samples:
         sample_data = vcf_data[sample].tolist()
-        processed_data = []
-        for genotype in sample_data:
-            if ':' in genotype:
-                genotype = genotype.split(':')[0]
-            if '|' in genotype:
-                alleles = genotype.split('|')
-            else:
-                alleles = genotype.split('/')
-            try:
-                sum_alleles = sum(int(allele) for allele in alleles)
-            except ValueError:
-                # 填充vcf文件
-                sum_alleles = -1
-            processed_data.append(sum_alleles)
+        processed_data = [genotype_dosage(genotype) for genotype in sample_data]
         vcf_arr.append(processed_data)
+    if return_markers:
+        return vcf_samples, vcf_arr, get_vcf_markers(vcf_data)
     return vcf_samples, vcf_arr
 
 
+def genotype_dosage(genotype):
+    """VCF 基因型字段 -> ALT 等位基因剂量，无法解析（缺失）时为 -1"""
+    if ':' in genotype:
+        genotype = genotype.split(':')[0]
+    if '|' in genotype:
+        alleles = genotype.split('|')
+    else:
+        alleles = genotype.split('/')
+    try:
+        return sum(int(allele) for allele in alleles)
+    except ValueError:
+        # 填充vcf文件
+        return -1
+
+
+def vcf_to_dosage_file(vcf_file, save_path):
+    """逐行把 VCF 剂量写入 int8 文件（标记 × 样本，缺失为 -1），内存占用只与样本数有关，返回 (样本 ID, 标记表)"""
+    opener = gzip.open if vcf_file.endswith('.gz') else open
+    dosages = {}
+    marker_rows = []
+    samples = []
+    with opener(vcf_file, 'rt') as f, open(save_path, 'wb') as out:
+        for line in f:
+            if line.startswith('##'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if line.startswith('#'):
+                samples = fields[9:]
+                continue
+            marker_rows.append(fields[:5])
+            row = np.empty(len(samples), dtype=np.int8)
+            for i, genotype in enumerate(fields[9:]):
+                # 只按 GT 子字段缓存：GT 的写法很少，而带 AD/DP/GQ/PL 的完整字段几乎各不相同，缓存会随文件增长
+                gt = genotype.split(':', 1)[0]
+                if gt not in dosages:
+                    dosages[gt] = genotype_dosage(gt)
+                row[i] = dosages[gt]
+            out.write(row.tobytes())
+    if not marker_rows or not samples:
+        raise ValueError(f"VCF 文件中没有标记或样本: {vcf_file}")
+    return samples, get_vcf_markers(pd.DataFrame(marker_rows))
+
+
+def iter_vcf_blocks(vcf_file, block_size=1000):
+    """按样本分块读取 VCF，内存占用只与块大小有关
+
+    先逐行把剂量写入临时的 int8 文件（标记 × 样本），再按样本块读出。
+    逐块产出 (样本 ID, 剂量矩阵(块样本数 × 标记数), 标记表)。
+    """
+    tmp = tempfile.NamedTemporaryFile(suffix=".int8", delete=False)
+    tmp.close()
+    dosage = None
+    try:
+        samples, markers = vcf_to_dosage_file(vcf_file, tmp.name)
+        dosage = np.memmap(tmp.name, dtype=np.int8, mode='r', shape=(len(markers), len(samples)))
+        for start in range(0, len(samples), block_size):
+            yield samples[start:start + block_size], np.ascontiguousarray(dosage[:, start:start + block_size].T), markers
+    finally:
+        del dosage
+        os.remove(tmp.name)
+
+
+def get_vcf_markers(vcf_data):
+    """VCF 的标记 ID 及 REF/ALT 编码，ID 为空时使用 染色体:位置"""
+    markers = vcf_data.iloc[:, :5].copy()
+    markers.columns = ["CHROM", "POS", "ID", "REF", "ALT"]
+    markers["ID"] = markers["ID"].astype(str)
+    no_id = markers["ID"].isin([".", "", "nan"])
+    markers.loc[no_id, "ID"] = markers.loc[no_id, "CHROM"].astype(str) + ":" + markers.loc[no_id, "POS"].astype(str)
+    return markers[["ID", "REF", "ALT"]].reset_index(drop=True)
+
+
 def get_sample_id(sample_file):
     if sample_file is None:
         return None
@@ -85,6 +155,23 @@ def get_pheno(phenotype_file, column, sample_ids=None):
         return pheno_data[column].tolist()
 
 
+def get_pheno_matrix(phenotype_file, columns=None, sample_ids=None):
+    """读取多个性状组成的表型矩阵，缺失值保留为 NaN"""
+    if phenotype_file.endswith('.csv'):
+        pheno_data = pd.read_csv(phenotype_file)
+    else:
+        pheno_data = pd.read_csv(phenotype_file, sep="\t")
+
+    sample_id_col = pheno_data.columns[0]
+    if columns is None:
+        columns = pheno_data.columns[1:].tolist()
+
+    if sample_ids is not None:
+        pheno_data = pheno_data[pheno_data[sample_id_col].isin(sample_ids)]
+        pheno_data = pheno_data.set_index(sample_id_col).loc[sample_ids].reset_index()
+    return pheno_data[columns].apply(pd.to_numeric, errors="coerce")
+
+
 def save_list_with_pandas(data, file_path):
     try:
         df = pd.DataFrame(data)
@@ -94,74 +181,197 @@ def save_list_with_pandas(data, file_path):
         print(f"保存失败：{str(e)}")
 
 
+def evaluate_predictions(y_test, test):
+    return {
+        "PCC": np.corrcoef(y_test, test)[0, 1],
+        "R²": r2_score(y_test, test),
+        "MSE": mean_squared_error(y_test, test),
+        "RMSE": np.sqrt(mean_squared_error(y_test, test)),
+        "y_test": y_test,
+        "y_pred": test,
+        "actual_vs_predicted": np.column_stack((y_test, test)).tolist()
+    }
+
+
 def genomic_selections(genotypes, phenotypic_data, model, threads, use_gpu, optimization,
-                       train_genotypes, train_ids):
+                       train_genotypes, train_ids, cv_folds=0, cv_repeats=1, progress=None, impute="mean",
+                       k=40000, p_value=None):
+    model = MODEL_ALIASES.get(model, model)
+    # 在线程预算中登记，模型和 BLAS/OpenMP 只使用分配到的线程数
+    with thread_budget(threads) as thread_report:
+        if progress is not None:
+            progress(describe_threads(thread_report))
+        # 缺失基因型(-1)在进入任何模型之前填充，填充参数由训练群体得到并同样用于预测群体
+        imputer = GenotypeImputer(impute).fit(genotypes)
+        genotypes = compact_genotypes(imputer.transform(genotypes))
+        if train_genotypes is not None:
+            train_genotypes = imputer.transform(train_genotypes)
+        if progress is not None and imputer.n_missing_:
+            progress(f"缺失基因型填充：{imputer.n_missing_} 个，方法 {impute}")
+        if isinstance(phenotypic_data, pd.DataFrame):
+            metrics = multi_trait_selections(genotypes, phenotypic_data, model, train_genotypes, train_ids,
+                                             progress)
+        else:
+            metrics = single_trait_selections(genotypes, phenotypic_data, model, thread_report["granted"], use_gpu,
+                                              optimization, train_genotypes, train_ids, cv_folds, cv_repeats,
+                                              progress, k, p_value)
+    metrics["threads"] = thread_report
+    metrics["imputer"] = imputer
+    return metrics
+
+
+def single_trait_selections(genotypes, phenotypic_data, model, threads, use_gpu, optimization,
+                            train_genotypes, train_ids, cv_folds=0, cv_repeats=1, progress=None, k=40000,
+                            p_value=None):
+    """单性状基因组选择；k / p_value 为标记预筛选的保留数量（个数或比例）/ p 值阈值，见 MarkerSelector"""
     try:
-
-        x_train, x_test, y_train, y_test = train_test_split(genotypes, phenotypic_data, test_size=0.4, random_state=0)
-
-        k = 40000
-        selector = SelectKBest(score_func=f_regression, k=k)
-        x_train = selector.fit_transform(x_train, y_train)
-        x_test = selector.transform(x_test)
-        train_genotypes = selector.transform(train_genotypes)
-
-        models = {
-            "GBLUP": gblup,
-            "KRR": KernelRidge(alpha=0.1, kernel='rbf'),
-            "BayesA": BayesianRidge(),
-            "rrBLUP": Ridge(alpha=1.0),
-            "LASSO": Lasso(alpha=0.01),
-            "SVR": SVR(kernel="linear", C=100, gamma="auto"),
-            "RF": RandomForestRegressor(n_estimators=500, n_jobs=threads, random_state=42),
-            "CatBoost": CatBoostRegressor(thread_count=threads, task_type="GPU" if use_gpu else "CPU", verbose=0),
-            "XGBoost": XGBRegressor(n_jobs=threads, tree_method="gpu_hist" if use_gpu else "auto"),
-            "LightGBM": LGBMRegressor(n_jobs=threads, device="gpu" if use_gpu else "cpu"),
-            "GBDT": GradientBoostingRegressor(),
-            "ElasticNet": ElasticNet(alpha=0.1, l1_ratio=0.5)
-        }
-
-        model_instance = models.get(model)
-        if model_instance is None:
-            raise ValueError(f"不支持的模型: {model}")
-
-        if model == "GBLUP":
-            _, test = model_instance(x_train, y_train, x_test)
-            train_matrix = np.empty((0, 2))
-            if train_genotypes is not None:
-                _, train_pred = model_instance(x_train, y_train, train_genotypes)
-                train_matrix = np.column_stack((train_ids, train_pred))
+        if cv_folds and cv_folds > 1:
+            # k 折交叉验证评估精度，最终模型使用全部训练数据拟合
+            x_train, y_train = genotypes, phenotypic_data
+        else:
+            x_train, x_test, y_train, y_test = train_test_split(genotypes, phenotypic_data, test_size=0.4,
+                                                                random_state=0)
+
+        # 在紧凑的基因型矩阵上筛选标记，只有保留的标记转换为工作精度（float32）
+        selector = MarkerSelector(k=k, p_value=p_value)
+        x_train = as_work(selector.fit_transform(x_train, y_train))
+
+        # 超参数优化
+        search = None
+        if optimization in OPTIMIZATION_METHODS:
+            search = HyperparameterSearch(model, method=OPTIMIZATION_METHODS[optimization], threads=threads,
+                                          use_gpu=use_gpu, progress=progress).fit(x_train, y_train)
+
+        model_instance = create_model(model, threads, use_gpu)
+        if search is not None:
+            model_instance.set_params(**search.best_params_)
+        if "progress" in model_instance.get_params():
+            model_instance.set_params(progress=progress)
+        model_instance.fit(x_train, y_train)
+
+        # 最终模型先于交叉验证拟合。只有各折在本进程中运行（threads == 1）且不做标记筛选（k="all"）时，
+        # 各折的训练矩阵才是最终训练矩阵的行子集，核模型可从已缓存的核矩阵切取；
+        # 否则各折重新筛选出不同的标记，或在工作进程中运行，核矩阵仍需各自计算
+        cv_result = None
+        if cv_folds and cv_folds > 1:
+            cv_result = cross_validate(genotypes, phenotypic_data, model, n_splits=cv_folds, n_repeats=cv_repeats,
+                                       threads=threads, use_gpu=use_gpu, k=k, p_value=p_value, progress=progress,
+                                       params=search.best_params_ if search is not None else None)
+            y_test, test = np.asarray(phenotypic_data, dtype=np.float64), cv_result["oof"]
         else:
-            # 其他模型保持原有的处理方式
-            model_instance.fit(x_train, y_train)
-            test = model_instance.predict(x_test)
-            train_matrix = np.empty((0, 2))
-            if train_genotypes is not None:
-                train_pred = model_instance.predict(train_genotypes)
-                train_matrix = np.column_stack((train_ids, train_pred))
-
-        metrics = {
-            "PCC": np.corrcoef(y_test, test)[0, 1],
-            "R²": r2_score(y_test, test),
-            "MSE": mean_squared_error(y_test, test),
-            "RMSE": np.sqrt(mean_squared_error(y_test, test)),
-            "y_test": y_test,
-            "y_pred": test,
-            "gebv": train_matrix.tolist(),
-            "actual_vs_predicted": np.column_stack((y_test, test)).tolist()
-        }
+            test = model_instance.predict(as_work(selector.transform(x_test)))
+
+        train_matrix = np.empty((0, 2))
+        if train_genotypes is not None:
+            train_pred = model_instance.predict(as_work(selector.transform(train_genotypes)))
+            train_matrix = np.column_stack((train_ids, train_pred))
+
+        metrics = evaluate_predictions(y_test, test)
+        if cv_result is not None:
+            # 交叉验证的精度指标取各折平均
+            for key in ("PCC", "R²", "RMSE"):
+                metrics[key] = np.mean([fold[key] for fold in cv_result["folds"]])
+            metrics["folds"] = cv_result["folds"]
+        metrics["gebv"] = train_matrix.tolist()
+        metrics["h2"] = getattr(model_instance, "h2_", None)
+        # 梯度提升模型早停得到的最优迭代次数，最终模型按该次数拟合
+        metrics["best_iteration"] = getattr(model_instance, "best_iteration_", None)
+        # 保存模型包所需的信息
+        metrics["model"] = model_instance
+        metrics["support"] = selector.get_support()
+        metrics["marker_means"] = np.mean(x_train, axis=0)
+        metrics["n_train"] = len(y_train)
+        if search is not None:
+            metrics["tuning"] = search
 
         return metrics
     except Exception as e:
         raise ValueError(f"基因组选择时发生错误: {str(e)}")
 
 
-def save_GEBV(GEBV, save_path="GEBV.csv"):
+def multi_trait_selections(genotypes, pheno_matrix, model, train_genotypes, train_ids, progress=None):
+    """多性状基因组选择：标准化基因型、核矩阵及其特征分解只计算一次，所有性状共同求解
+
+    多性状共享同一核矩阵，因此不做逐性状的标记预筛选，使用全部标记。
+    训练集或测试集中有效数值少于 2 个的性状（如非数值列）跳过并给出提示。
+    """
+    try:
+        if model not in MULTI_TRAIT_MODELS:
+            raise ValueError(f"多性状模式仅支持 {'/'.join(MULTI_TRAIT_MODELS)}，当前模型: {model}")
+
+        X = as_work(genotypes)
+        train_idx, test_idx = train_test_split(np.arange(X.shape[0]), test_size=0.4, random_state=0)
+        observed = pheno_matrix.notna().to_numpy()
+        usable = (observed[train_idx].sum(axis=0) >= 2) & (observed[test_idx].sum(axis=0) >= 2)
+        skipped = pheno_matrix.columns[~usable].tolist()
+        if skipped and progress is not None:
+            progress(f"以下性状的有效数值不足（非数值列或缺失过多），已跳过：{', '.join(map(str, skipped))}")
+        if not usable.any():
+            raise ValueError("没有可用于分析的数值性状")
+        traits = pheno_matrix.columns[usable].tolist()
+        Y = pheno_matrix[traits].to_numpy(dtype=np.float64)
+        X_train = X[train_idx]
+
+        if model == "KRR":
+            # 与单性状 KRR 一致：原始剂量上的 RBF 核，表型不中心化；训练核取自核缓存
+            gamma = 1.0 / X.shape[1]
+            cache = kernel_cache(X_train)
+            K = cache.kernel("rbf", gamma)
+            coef, intercept, h2 = solve_kernel_traits(K, Y[train_idx], alpha=0.1, center=False)
+
+            def predict(X_new):
+                return np.dot(cross_kernel(X_new, X_train, cache.sq_norms, "rbf", gamma), coef) + intercept
+        elif model == "RKHS":
+            # 成分核由完整训练集构建，各网格点的加权核在本次拟合中只分解一次、所有性状共用，
+            # 有缺失表型的性状在同一特征基下求解；预测时的交叉成分核也只计算一次
+            trait_models = fit_rkhs_traits(X_train, Y[train_idx], [MultiKernelModel() for _ in traits])
+            h2 = np.array([m.h2_ for m in trait_models])
+            needed = np.any([m.weights_ > 0 for m in trait_models], axis=0)
+
+            def predict(X_new):
+                cross = trait_models[0].cross_kernels(X_new, needed)
+                return np.column_stack([m.predict_kernels(cross) for m in trait_models])
+        elif model == "rrBLUP":
+            # 与单性状 RRBLUPModel 一致：中心化剂量上的岭回归，按性状在同一 alpha 网格上以留一误差选择 alpha
+            X_mean = X_train.mean(axis=0, dtype=np.float64)
+            Xc = X_train - X_mean.astype(X_train.dtype)
+            K = blocked_products(Xc, Xc)
+            coef, intercept, h2 = solve_kernel_traits(K, Y[train_idx], alpha="loo")
+
+            def predict(X_new):
+                return np.dot(blocked_products(X_new - X_mean.astype(X_new.dtype), Xc), coef) + intercept
+        else:
+            # GBLUP 使用 G = XXᵀ/p 并按性状 REML 估计收缩参数
+            scaler = StandardScaler()
+            X_scaled = scaler.fit_transform(X_train)
+            K = blocked_products(X_scaled, X_scaled) / X_scaled.shape[1]
+            coef, intercept, h2 = solve_kernel_traits(K, Y[train_idx])
+
+            def predict(X_new):
+                return np.dot(blocked_products(scaler.transform(X_new), X_scaled) / X_scaled.shape[1], coef) + intercept
+
+        test_pred = predict(X[test_idx])
+        trait_metrics = {}
+        for j, trait in enumerate(traits):
+            mask = ~np.isnan(Y[test_idx, j])
+            trait_metrics[trait] = evaluate_predictions(Y[test_idx, j][mask], test_pred[mask, j])
+            trait_metrics[trait]["h2"] = None if np.isnan(h2[j]) else h2[j]
+
+        gebv = np.empty((0, len(traits) + 1))
+        if train_genotypes is not None:
+            gebv = np.column_stack((train_ids, predict(as_work(train_genotypes))))
+
+        return {"traits": trait_metrics, "gebv": gebv.tolist()}
+    except Exception as e:
+        raise ValueError(f"多性状基因组选择时发生错误: {str(e)}")
+
+
+def save_GEBV(GEBV, save_path="GEBV.csv", columns=None):
     try:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
         df = pd.DataFrame(
             GEBV,
-            columns=["SampleID", "GEBV"]
+            columns=columns or ["SampleID", "GEBV"]
         )
         df.to_csv(save_path, index=False)
         print(f"成功保存预测结果至：{os.path.abspath(save_path)}")
@@ -187,50 +397,10 @@ def save_actual_vs_predicted(result, save_path="actual_vs_predicted.csv"):
 
 
 def gblup(X_train, y_train, X_test=None, h2=0.5, lambda_param=1e-6):
-    # 保存原始数据的均值
-    y_mean = np.mean(y_train)
-
-    # 标准化基因型数据
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-
-    n_train = X_train_scaled.shape[0]
-
-    # 计算加性遗传关系矩阵(G)
-    G_train = np.dot(X_train_scaled, X_train_scaled.T) / X_train_scaled.shape[1]
-
-    # 添加一个小的对角线项以确保矩阵是正定的
-    G_train += np.eye(n_train) * lambda_param
-
-    # 计算方差组分
-    Vg = h2 * np.var(y_train)  # 基因型方差
-    Ve = (1 - h2) * np.var(y_train)  # 环境方差
-
-    # 构建混合模型方程
-    V = G_train * Vg + np.eye(n_train) * Ve
-
-    # 求解混合模型方程
-    gebv_train = Vg * np.dot(G_train, linalg.solve(V, (y_train - y_mean)))
-
-    # 将育种值转换回原始尺度
-    gebv_train = gebv_train + y_mean
-
+    model = GBLUPModel(h2=h2, lambda_param=lambda_param).fit(X_train, y_train)
     if X_test is not None:
-        # 使用相同的scaler转换测试数据
-        X_test_scaled = scaler.transform(X_test)
-
-        # 计算测试集的G矩阵
-        G_test = np.dot(X_test_scaled, X_train_scaled.T) / X_train_scaled.shape[1]
-
-        # 预测测试集的GEBV
-        gebv_test = Vg * np.dot(G_test, linalg.solve(V, (y_train - y_mean)))
-
-        # 将育种值转换回原始尺度
-        gebv_test = gebv_test + y_mean
-
-        return gebv_train, gebv_test
-
-    return gebv_train
+        return model.gebv_train_, model.predict(X_test)
+    return model.gebv_train_
 
 
 def visualize_results(metrics, save_dir="results"):
@@ -0,0 +1,187 @@
+import math
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+import numpy as np
+from scipy.linalg import blas
+from sklearn.base import BaseEstimator, RegressorMixin
+
+from gs_shared import SharedArray, attach
+from gs_threads import limit_threads
+
+BAYES_METHODS = ("BayesA", "BayesB", "BayesCπ")
+
+
+def _gibbs_chain(task):
+    """单条 Gibbs 链：维护残差向量，每个标记的更新只需一次 O(n) 点积和一次 axpy"""
+    # 共享的是按列存储的 Xᵀ（p × n），每个标记的基因型是连续内存
+    return _sample(attach(task["geno"]), task)
+
+
+def _sample(X_t, task):
+    method, y = task["method"], task["y"]
+    n_iter, burn_in, thin = task["n_iter"], task["burn_in"], task["thin"]
+    rng = np.random.default_rng(task["seed"])
+    n_markers, n_samples = X_t.shape
+    report = task.get("queue")
+
+    xtx = np.einsum("ij,ij->i", X_t, X_t, dtype=np.float64)
+    xtx[xtx == 0] = 1e-12
+
+    # 先验：参照 BGLR，按期望的遗传方差比例 R2 设定标记方差和残差方差的尺度
+    var_y = np.var(y)
+    sum_var_x = xtx.sum() / n_samples
+    pi = task["pi"]
+    df_b, df_e = task["df"], 5.0
+    var_b = task["r2"] * var_y / (sum_var_x * (1 - pi if method != "BayesA" else 1))
+    scale_b = var_b * (df_b - 2) / df_b
+    scale_e = (1 - task["r2"]) * var_y * (df_e + 2) / df_e
+
+    mu = float(np.mean(y))
+    beta = np.zeros(n_markers, dtype=np.float32)
+    var_j = np.full(n_markers, var_b)
+    var_e = (1 - task["r2"]) * var_y
+    resid = (y - mu).astype(np.float32)
+
+    sum_beta = np.zeros(n_markers)
+    sum_mu = sum_var_e = sum_pi = 0.0
+    n_kept = 0
+    step = max(1, n_iter // 20)
+
+    for it in range(n_iter):
+        # 截距
+        resid += mu
+        mu = float(np.mean(resid)) + math.sqrt(var_e / n_samples) * rng.standard_normal()
+        resid -= mu
+
+        # 每轮预先生成随机数，减少循环内的开销
+        z = rng.standard_normal(n_markers)
+        u = rng.random(n_markers)
+        var_used = var_j if method != "BayesCπ" else np.full(n_markers, var_j[0])
+        for j in range(n_markers):
+            x = X_t[j]
+            b_old = float(beta[j])
+            rhs = float(blas.sdot(x, resid)) + xtx[j] * b_old
+            vj = var_used[j]
+            lhs = xtx[j] + var_e / vj
+            if method != "BayesA":
+                # 积分掉 β_j 后的似然比，决定标记是否有效应
+                log_ratio = 0.5 * (rhs * rhs / (var_e * lhs) - math.log(vj * xtx[j] / var_e + 1))
+                p_in = 1 / (1 + pi / (1 - pi) * math.exp(-max(min(log_ratio, 700.0), -700.0)))
+                b_new = rhs / lhs + math.sqrt(var_e / lhs) * z[j] if u[j] < p_in else 0.0
+            else:
+                b_new = rhs / lhs + math.sqrt(var_e / lhs) * z[j]
+            if b_new != b_old:
+                resid = blas.saxpy(x, resid, a=b_old - b_new)
+                beta[j] = b_new
+
+        # 方差组分
+        b2 = beta.astype(np.float64) ** 2
+        nonzero = int(np.count_nonzero(beta))
+        if method == "BayesCπ":
+            var_j[:] = (df_b * scale_b + b2.sum()) / rng.chisquare(df_b + nonzero)
+            pi = rng.beta(n_markers - nonzero + 1, nonzero + 1)
+        else:
+            # BayesA 及 BayesB 中有效应的标记由后验抽样，BayesB 中无效应的标记由先验抽样
+            var_j = (df_b * scale_b + b2) / rng.chisquare(df_b + 1, n_markers)
+            if method == "BayesB":
+                var_j[beta == 0] = df_b * scale_b / rng.chisquare(df_b, n_markers - nonzero)
+        if it % 10 == 0:
+            # 定期重算残差，消除 float32 累积误差
+            resid = (y - mu - np.dot(beta, X_t)).astype(np.float32)
+        var_e = (float(np.dot(resid, resid)) + df_e * scale_e) / rng.chisquare(n_samples + df_e)
+
+        if it >= burn_in and (it - burn_in) % thin == 0:
+            sum_beta += beta
+            sum_mu += mu
+            sum_var_e += var_e
+            sum_pi += pi
+            n_kept += 1
+        if report is not None and (it + 1) % step == 0:
+            report.put(f"{method} 链 {task['chain']}: {it + 1}/{n_iter} 次迭代")
+
+    n_kept = max(n_kept, 1)
+    return {"beta": sum_beta / n_kept, "mu": sum_mu / n_kept, "var_e": sum_var_e / n_kept, "pi": sum_pi / n_kept}
+
+
+class BayesAlphabetModel(BaseEstimator, RegressorMixin):
+    """贝叶斯字母表模型（BayesA / BayesB / BayesCπ）的 Gibbs 抽样
+
+    基因型中心化后以 float32 按列存储，每条链维护残差向量和预先计算的列平方和，
+    单个标记的更新为 O(n)。多条链在独立进程中并行，结果取各链后验均值的平均。
+    pi 为标记无效应的先验比例（BayesB 固定，BayesCπ 作为初值并参与抽样）。
+    """
+
+    def __init__(self, method="BayesA", n_iter=1500, burn_in=500, thin=5, n_chains=1, n_jobs=1, pi=0.95,
+                 df=4.2, r2=0.5, random_state=0, progress=None):
+        self.method = method
+        self.n_iter = n_iter
+        self.burn_in = burn_in
+        self.thin = thin
+        self.n_chains = n_chains
+        self.n_jobs = n_jobs
+        self.pi = pi
+        self.df = df
+        self.r2 = r2
+        self.random_state = random_state
+        self.progress = progress
+
+    def fit(self, X, y):
+        if self.method not in BAYES_METHODS:
+            raise ValueError(f"不支持的贝叶斯方法: {self.method}")
+        X = np.asarray(X, dtype=np.float32)
+        self.X_mean_ = X.mean(axis=0)
+        # Xᵀ 按行连续即 X 按列存储
+        X_t = np.ascontiguousarray((X - self.X_mean_).T)
+        del X
+
+        base = {"method": self.method, "y": np.asarray(y, dtype=np.float64), "n_iter": self.n_iter,
+                "burn_in": self.burn_in, "thin": self.thin, "pi": self.pi, "df": self.df, "r2": self.r2}
+        seeds = np.random.SeedSequence(self.random_state).spawn(self.n_chains)
+        n_workers = max(1, min(self.n_jobs, self.n_chains, os.cpu_count() or 1))
+
+        if n_workers == 1:
+            chains = []
+            for chain, seed in enumerate(seeds):
+                report = _ForwardQueue(self.progress)
+                chains.append(_sample(X_t, dict(base, seed=seed, chain=chain, queue=report)))
+        else:
+            with SharedArray(X_t) as shared:
+                del X_t
+                with Manager() as manager, ProcessPoolExecutor(max_workers=n_workers, initializer=limit_threads,
+                                                                initargs=(1,)) as executor:
+                    report = manager.Queue()
+                    futures = [executor.submit(_gibbs_chain, dict(base, geno=shared.desc, seed=seed, chain=chain,
+                                                                  queue=report))
+                               for chain, seed in enumerate(seeds)]
+                    # 在主进程中转发各链的进度
+                    while not all(f.done() for f in futures):
+                        try:
+                            message = report.get(timeout=0.5)
+                        except queue.Empty:
+                            continue
+                        if self.progress is not None:
+                            self.progress(message)
+                    chains = [f.result() for f in futures]
+
+        self.coef_ = np.mean([c["beta"] for c in chains], axis=0)
+        self.intercept_ = float(np.mean([c["mu"] for c in chains])) - np.dot(self.X_mean_, self.coef_)
+        self.var_e_ = float(np.mean([c["var_e"] for c in chains]))
+        self.pi_ = float(np.mean([c["pi"] for c in chains]))
+        return self
+
+    def predict(self, X):
+        return np.dot(np.asarray(X, dtype=np.float64), self.coef_) + self.intercept_
+
+
+class _ForwardQueue:
+    """单进程运行时代替进度队列，直接调用进度回调"""
+
+    def __init__(self, progress):
+        self.progress = progress
+
+    def put(self, message):
+        if self.progress is not None:
+            self.progress(message)
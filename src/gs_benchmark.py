@@ -0,0 +1,104 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score, mean_squared_error
+from sklearn.model_selection import train_test_split
+
+from gs_models import create_model
+from gs_precision import as_work
+from gs_screen import MarkerSelector
+from gs_impute import GenotypeImputer
+from gs_shared import attach_genotypes, compact_genotypes, publish_genotypes
+from gs_threads import thread_budget, describe_threads, limit_threads
+
+
+def _fit_model(task):
+    X = attach_genotypes(task["geno"])
+    x_train = as_work(X[task["train_idx"]])
+    x_test = as_work(X[task["test_idx"]])
+
+    row = {"Model": task["model"]}
+    try:
+        model_instance = create_model(task["model"], task["threads"], task["use_gpu"])
+        start = time.perf_counter()
+        model_instance.fit(x_train, task["y_train"])
+        row["FitTime(s)"] = time.perf_counter() - start
+        pred = model_instance.predict(x_test)
+        y_test = task["y_test"]
+        row.update({
+            "PCC": np.corrcoef(y_test, pred)[0, 1],
+            "R²": r2_score(y_test, pred),
+            "RMSE": np.sqrt(mean_squared_error(y_test, pred)),
+            "Threads": task["threads"],
+        })
+        if getattr(model_instance, "best_iteration_", None) is not None:
+            row["BestIteration"] = model_instance.best_iteration_
+    except Exception as e:
+        # 单个模型失败不影响其他模型，错误记录在排行榜中
+        row["Error"] = str(e)
+    return row
+
+
+def benchmark_models(genotypes, phenotypic_data, models, threads, use_gpu, k=40000, test_size=0.4,
+                     random_state=0, progress=None, impute="mean"):
+    """多模型对比：基因型只读取、划分和筛选一次，各模型在进程池中并行拟合
+
+    线程预算在同时运行的模型之间平均分配，避免超额订阅。返回按 PCC 排序的排行榜。
+    """
+    X = compact_genotypes(GenotypeImputer(impute).fit_transform(genotypes))
+    y = np.asarray(phenotypic_data, dtype=np.float64)
+    train_idx, test_idx = train_test_split(np.arange(X.shape[0]), test_size=test_size, random_state=random_state)
+
+    # 所有模型共用同一次标记筛选
+    selector = MarkerSelector(k=k).fit(X[train_idx], y[train_idx])
+    X = np.ascontiguousarray(X[:, selector.get_support()])
+
+    with thread_budget(threads) as thread_report:
+        if progress is not None:
+            progress(describe_threads(thread_report))
+        return _run_models(X, y, models, thread_report["granted"], use_gpu, train_idx, test_idx, progress)
+
+
+def _run_models(X, y, models, threads, use_gpu, train_idx, test_idx, progress):
+    n_workers = max(1, min(len(models), threads, os.cpu_count() or 1))
+    model_threads = max(1, threads // n_workers)
+
+    with publish_genotypes(X) as shared:
+        del X
+        tasks = [{
+            "geno": shared.desc, "model": model, "threads": model_threads, "use_gpu": use_gpu,
+            "train_idx": train_idx, "test_idx": test_idx, "y_train": y[train_idx], "y_test": y[test_idx],
+        } for model in models]
+
+        rows = []
+        if n_workers == 1:
+            for task in tasks:
+                rows.append(_fit_model(task))
+                if progress is not None:
+                    progress(f"模型 {rows[-1]['Model']} 完成 ({len(rows)}/{len(tasks)})")
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=limit_threads,
+                                     initargs=(model_threads,)) as executor:
+                for future in as_completed([executor.submit(_fit_model, task) for task in tasks]):
+                    rows.append(future.result())
+                    if progress is not None:
+                        progress(f"模型 {rows[-1]['Model']} 完成 ({len(rows)}/{len(tasks)})")
+
+    leaderboard = pd.DataFrame(rows)
+    if "PCC" in leaderboard:
+        leaderboard = leaderboard.sort_values("PCC", ascending=False, na_position="last")
+    return leaderboard.reset_index(drop=True)
+
+
+def save_leaderboard(leaderboard, save_path="leaderboard.csv"):
+    try:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        leaderboard.to_csv(save_path, index=False)
+        print(f"成功保存模型对比结果至：{os.path.abspath(save_path)}")
+        return True
+    except Exception as e:
+        print(f"保存模型对比结果失败：{str(e)}")
+        return False
@@ -0,0 +1,548 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import linalg, optimize
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.preprocessing import StandardScaler
+
+from gs_cache import matrix_digest
+from gs_precision import as_work, blocked_dot, blocked_products, blocked_t_dot
+
+
+# G 矩阵特征分解缓存：只在 eigen_scope 作用域（一次运行）内有效，同一群体（相同的标准化基因型）的各次拟合共用一次
+# O(n³) 分解，作用域退出时释放；作用域之外不缓存
+_EIGEN_CACHE_SIZE = 4
+_local = threading.local()
+
+
+@contextmanager
+def eigen_scope():
+    """作用域内（当前线程）的 G / 核矩阵特征分解按内容缓存，退出时释放，包括中途抛出异常的情况"""
+    scopes = _local.__dict__.setdefault("scopes", [])
+    scopes.append({})
+    try:
+        yield
+    finally:
+        scopes.pop()
+
+
+def _scoped_eigen(key, compute):
+    scopes = getattr(_local, "scopes", None)
+    if not scopes:
+        return compute()
+    # 只有在作用域内才计算内容摘要
+    cache, key = scopes[-1], key()
+    if key not in cache:
+        if len(cache) >= _EIGEN_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[key] = compute()
+    return cache[key]
+
+
+def genomic_eigen(X_scaled):
+    """计算 G = XXᵀ/p 及其特征分解（eigen_scope 内按基因型内容缓存）；XXᵀ 按标记块累加，G 和分解为 float64"""
+    X_scaled = np.ascontiguousarray(X_scaled)
+
+    def compute():
+        G = blocked_products(X_scaled, X_scaled) / X_scaled.shape[1]
+        eigvals, eigvecs = linalg.eigh(G, check_finite=False)
+        # 数值误差可能产生极小的负特征值
+        return G, np.clip(eigvals, 0, None), eigvecs
+
+    return _scoped_eigen(lambda: ("genomic", matrix_digest(X_scaled)), compute)
+
+
+def kernel_eigen(K):
+    """预计算核矩阵的特征分解，与 genomic_eigen 共用作用域内的缓存"""
+    K = np.ascontiguousarray(K, dtype=np.float64)
+
+    def compute():
+        eigvals, eigvecs = linalg.eigh(K, check_finite=False)
+        return None, np.clip(eigvals, 0, None), eigvecs
+
+    return _scoped_eigen(lambda: ("kernel", matrix_digest(K)), compute)
+
+
+def reml_neg_loglik(eigvals, y_rot, x_rot, delta):
+    """给定 δ 时的 REML 负对数似然（省略常数项），每次计算为 O(n)"""
+    df = len(y_rot) - 1
+    d = eigvals + delta
+    w = 1 / d
+    xhx = np.dot(w, x_rot ** 2)
+    rhr = np.dot(w, y_rot ** 2) - np.dot(w, x_rot * y_rot) ** 2 / xhx
+    return 0.5 * (df * np.log(rhr / df) + np.sum(np.log(d)) + np.log(xhx))
+
+
+def search_log_delta(neg_reml, n_grid=100, log_delta_bounds=(-5, 5)):
+    """对 log10(δ) 最小化 REML 负对数似然：先网格搜索，再在最优网格点附近用 Brent 法细化"""
+    grid = np.linspace(log_delta_bounds[0], log_delta_bounds[1], n_grid)
+    values = [neg_reml(v) for v in grid]
+    i = int(np.argmin(values))
+    lo, hi = grid[max(i - 1, 0)], grid[min(i + 1, n_grid - 1)]
+    res = optimize.minimize_scalar(neg_reml, bounds=(lo, hi), method="bounded")
+    return res.x if res.fun < values[i] else grid[i]
+
+
+def reml_delta(eigvals, y_rot, x_rot, n_grid=100, log_delta_bounds=(-5, 5)):
+    """EMMA 式 REML：在 G 的特征基下优化 δ = Ve/Vg，每次似然计算为 O(n)
+
+    eigvals 为 G 的特征值，y_rot、x_rot 为表型和截距列在特征向量上的投影，
+    返回 (δ, Vg)。
+    """
+    df = len(y_rot) - 1
+    x2, xy, y2 = x_rot ** 2, x_rot * y_rot, y_rot ** 2
+
+    def neg_reml(log_delta):
+        return reml_neg_loglik(eigvals, y_rot, x_rot, 10 ** log_delta)
+
+    delta = 10 ** search_log_delta(neg_reml, n_grid, log_delta_bounds)
+    w = 1 / (eigvals + delta)
+    xhx = np.dot(w, x2)
+    vg = (np.dot(w, y2) - np.dot(w, xy) ** 2 / xhx) / df
+    return delta, vg
+
+
+class MarkerEffectModel:
+    """由 GBLUP 反解得到的等价标记效应模型，预测只需一次 SNP 维度的矩阵-向量乘积，与参考群体大小无关"""
+
+    def __init__(self, effects, means, scales, y_mean, block_size=10000):
+        self.effects = effects  # 标准化尺度下的标记效应 û
+        self.means = means
+        self.scales = scales
+        self.y_mean = y_mean
+        self.block_size = block_size
+        # 折算到原始剂量尺度：GEBV = X·coef + intercept
+        self.coef_ = effects / scales
+        self.intercept_ = y_mean - np.dot(means, self.coef_)
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if X.shape[0] <= self.block_size:
+            return blocked_dot(X, self.coef_) + self.intercept_
+        return np.concatenate(list(self.predict_blocks(
+            X[start:start + self.block_size] for start in range(0, X.shape[0], self.block_size))))
+
+    def predict_blocks(self, blocks):
+        """逐块预测，适合流式读取的大规模候选群体"""
+        for block in blocks:
+            yield blocked_dot(np.asarray(block), self.coef_) + self.intercept_
+
+
+class GBLUPModel(BaseEstimator, RegressorMixin):
+    """GBLUP 模型：拟合时只对 V 做一次 Cholesky 分解，缓存 α = V⁻¹(y−ȳ)，预测时只计算与训练集的交叉核
+
+    h2="reml" 时通过 G 的特征分解按性状估计遗传力，此时直接在特征基下求解 α。
+    back_solve=True 时拟合后反解为标记效应 û = Xᵀα·Vg/p 并释放训练集基因型，预测改为标记效应模型。
+    kernel="precomputed" 时 fit 的输入为训练集核矩阵（代替 G），predict 的输入为与训练集的交叉核，不能反解标记效应，
+    并可通过 extend 分块追加训练样本。
+    """
+
+    def __init__(self, h2="reml", lambda_param=1e-6, back_solve=False, kernel=None):
+        self.h2 = h2
+        self.lambda_param = lambda_param
+        self.back_solve = back_solve
+        self.kernel = kernel
+
+    def fit(self, X, y):
+        y = np.asarray(y, dtype=np.float64)
+        self.y_mean_ = np.mean(y)
+        self.y_train_ = y
+
+        G_train = None
+        if self.kernel == "precomputed":
+            self.scaler_, self.X_train_ = None, None
+            G_train = np.asarray(X, dtype=np.float64)
+        else:
+            # 标准化基因型数据（float32），保存 scaler 和训练集基因型用于预测
+            self.scaler_ = StandardScaler()
+            self.X_train_ = self.scaler_.fit_transform(as_work(X))
+
+        if self.h2 == "reml":
+            self._fit_reml(y, G_train)
+        else:
+            self._fit_fixed(y, G_train)
+
+        self.marker_model_ = None
+        if self.back_solve and self.kernel != "precomputed":
+            self.marker_model_ = self.marker_effects()
+            self.X_train_ = None
+        return self
+
+    def _fit_fixed(self, y, G_train=None):
+        if G_train is None:
+            # 计算加性遗传关系矩阵(G)
+            G_train = blocked_products(self.X_train_, self.X_train_) / self.X_train_.shape[1]
+        else:
+            G_train = G_train.copy()
+        n_train = G_train.shape[0]
+        # 添加一个小的对角线项以确保矩阵是正定的
+        G_train[np.diag_indices(n_train)] += self.lambda_param
+
+        # 计算方差组分
+        self.h2_ = self.h2
+        self.vg_ = self.h2 * np.var(y)  # 基因型方差
+        self.ve_ = (1 - self.h2) * np.var(y)  # 环境方差
+
+        # 构建混合模型方程并做 Cholesky 分解
+        V = G_train * self.vg_
+        V[np.diag_indices(n_train)] += self.ve_
+        self.cho_factor_ = linalg.cho_factor(V, lower=True, overwrite_a=True, check_finite=False)
+        self.alpha_ = linalg.cho_solve(self.cho_factor_, y - self.y_mean_, check_finite=False)
+
+        # 训练集的 GEBV
+        self.gebv_train_ = self.vg_ * np.dot(G_train, self.alpha_) + self.y_mean_
+
+    def _fit_reml(self, y, G_train=None):
+        _, eigvals, eigvecs = genomic_eigen(self.X_train_) if G_train is None else kernel_eigen(G_train)
+        eigvals = eigvals + self.lambda_param
+        y_rot = np.dot(eigvecs.T, y)
+        x_rot = eigvecs.sum(axis=0)
+
+        delta, self.vg_ = reml_delta(eigvals, y_rot, x_rot)
+        self.ve_ = delta * self.vg_
+        self.h2_ = 1 / (1 + delta)
+
+        # V⁻¹ = U diag(1 / (Vg(λ + δ))) Uᵀ
+        self.cho_factor_ = None
+        r_rot = y_rot - x_rot * self.y_mean_
+        self.alpha_ = np.dot(eigvecs, r_rot / (self.vg_ * (eigvals + delta)))
+        self.gebv_train_ = np.dot(eigvecs, eigvals / (eigvals + delta) * r_rot) + self.y_mean_
+
+    def extend(self, K_cross, K_new, y_new, K_train=None):
+        """追加一批训练样本（kernel="precomputed"），方差组分保持不变
+
+        K_cross 为新样本与已有训练样本的核（b×n），K_new 为新样本之间的核（b×b）。
+        V = Vg(G + λI) + VeI 的 Cholesky 因子按分块更新：L₂₁ = K_crossᵀ 对 L₁₁ 的三角求解，
+        L₂₂ 为 Schur 补的 Cholesky 分解，代价为 O(n²b + b³)，已有部分不重新分解。
+        REML 拟合时在特征基下求解、没有 Cholesky 因子，首次追加需要传入已有训练集的核 K_train 构造一次。
+        """
+        if self.kernel != "precomputed":
+            raise ValueError("只有 kernel=\"precomputed\" 的 GBLUP 模型可以追加训练样本")
+        K_cross = np.asarray(K_cross, dtype=np.float64)
+        K_new = np.asarray(K_new, dtype=np.float64)
+        y_new = np.asarray(y_new, dtype=np.float64)
+        n, b = len(self.y_train_), len(y_new)
+        if K_cross.shape != (b, n) or K_new.shape != (b, b):
+            raise ValueError(f"追加样本的核矩阵形状{K_cross.shape}/{K_new.shape}与样本数({b})或训练集大小({n})不一致")
+
+        if self.cho_factor_ is None:
+            if K_train is None:
+                raise ValueError("REML 拟合的模型首次追加训练样本时需要提供训练集核矩阵 K_train")
+            V = np.asarray(K_train, dtype=np.float64) * self.vg_
+            V[np.diag_indices(n)] += self.vg_ * self.lambda_param + self.ve_
+            self.cho_factor_ = linalg.cho_factor(V, lower=True, overwrite_a=True, check_finite=False)
+
+        L11 = self.cho_factor_[0]
+        L21 = linalg.solve_triangular(L11, self.vg_ * K_cross.T, lower=True, check_finite=False).T
+        S = self.vg_ * K_new - np.dot(L21, L21.T)
+        S[np.diag_indices(b)] += self.vg_ * self.lambda_param + self.ve_
+        L = np.zeros((n + b, n + b))
+        # cho_factor 只保证下三角有效
+        L[:n, :n] = np.tril(L11)
+        L[n:, :n] = L21
+        L[n:, n:] = linalg.cholesky(S, lower=True, check_finite=False)
+        self.cho_factor_ = (L, True)
+
+        self.y_train_ = np.concatenate([self.y_train_, y_new])
+        self.y_mean_ = np.mean(self.y_train_)
+        self.alpha_ = linalg.cho_solve(self.cho_factor_, self.y_train_ - self.y_mean_, check_finite=False)
+        # 训练集 GEBV 需要完整的训练集核矩阵，追加后不再维护
+        self.gebv_train_ = None
+        return self
+
+    def set_marker_effects(self, effects, means, scales):
+        """设置在外部按标记块反解得到的标记效应（外存模式），之后预测使用标记效应模型"""
+        self.marker_model_ = MarkerEffectModel(effects, means, scales, self.y_mean_)
+        self.X_train_ = None
+        return self
+
+    def marker_effects(self):
+        """将已拟合的 GBLUP 转换为等价的标记效应模型"""
+        if self.marker_model_ is not None:
+            return self.marker_model_
+        effects = self.vg_ * blocked_t_dot(self.X_train_, self.alpha_) / self.X_train_.shape[1]
+        return MarkerEffectModel(effects, self.scaler_.mean_, self.scaler_.scale_, self.y_mean_)
+
+    def predict(self, X):
+        if self.marker_model_ is not None:
+            return self.marker_model_.predict(X)
+        if self.kernel == "precomputed":
+            return self.vg_ * np.dot(np.asarray(X, dtype=np.float64), self.alpha_) + self.y_mean_
+        # 使用相同的 scaler 转换数据，计算与训练集的 G 矩阵
+        X_scaled = self.scaler_.transform(as_work(X))
+        G_cross = blocked_products(X_scaled, self.X_train_) / self.X_train_.shape[1]
+        return self.vg_ * np.dot(G_cross, self.alpha_) + self.y_mean_
+
+
+class RRBLUPModel(BaseEstimator, RegressorMixin):
+    """rrBLUP（岭回归）正则化路径：只做一次分解，整条 alpha 网格的系数、预测和留一/GCV 误差均为闭式解
+
+    p > n 时分解 XXᵀ（n×n），否则对 X 做瘦 SVD。alphas=None 时使用相对于平均奇异值平方的对数网格，
+    criterion 为 "loo"（留一误差）或 "gcv"（广义交叉验证），按其选择最终的 alpha。
+    整条路径的系数只在拟合后的同一进程中可用，序列化（模型包）时只保留所选 alpha 的 coef_。
+    """
+
+    def __init__(self, alphas=None, criterion="loo"):
+        self.alphas = alphas
+        self.criterion = criterion
+
+    def fit(self, X, y):
+        X = as_work(X)
+        y = np.asarray(y, dtype=np.float64)
+        n_samples, n_features = X.shape
+
+        # 与 Ridge 一致：中心化 X 和 y，截距不参与惩罚；中心化基因型保持 float32，均值按 float64 累加
+        self.X_mean_ = X.mean(axis=0, dtype=np.float64)
+        self.y_mean_ = y.mean()
+        Xc = X - self.X_mean_.astype(X.dtype)
+        yc = y - self.y_mean_
+
+        if n_features > n_samples:
+            s2, U = linalg.eigh(blocked_products(Xc, Xc), check_finite=False)
+        else:
+            U, s, _ = linalg.svd(Xc.astype(np.float64), full_matrices=False, check_finite=False)
+            s2 = s ** 2
+        self._fit_path(s2, U, yc)
+
+        # 只保留系数所需的投影，coef = Xcᵀ U diag(1 / (s² + α)) Uᵀ y
+        self._Xc_t_U = blocked_t_dot(Xc, self._U)
+        del self._U
+        self.coef_ = self.coef_path([self.alpha_])[:, 0]
+        self.intercept_ = self.y_mean_ - np.dot(self.X_mean_, self.coef_)
+        return self
+
+    def fit_gram(self, K, y):
+        """由中心化基因型的内积矩阵 K = XcXcᵀ 拟合（外存模式，基因型不在内存中）
+
+        只得到对偶系数 dual_coef_（预测值为 Xc_new·Xcᵀ·dual_coef_ + ȳ），标记效应 Xcᵀ·dual_coef_
+        由调用方按标记块计算后通过 set_marker_effects 设置。
+        """
+        y = np.asarray(y, dtype=np.float64)
+        self.y_mean_ = y.mean()
+        s2, U = linalg.eigh(np.asarray(K, dtype=np.float64), check_finite=False)
+        self._fit_path(s2, U, y - self.y_mean_)
+        self.dual_coef_ = np.dot(self._U, self._Uty / (self._s2 + self.alpha_))
+        self._Xc_t_U = None
+        del self._U
+        return self
+
+    def __getstate__(self):
+        # 路径投影 XcᵀU 为 p × 秩 的 float64 矩阵，只在拟合所在进程中用于 coef_path，不写入模型包
+        state = dict(super().__getstate__())
+        if state.get("_Xc_t_U") is not None:
+            state["_Xc_t_U"] = None
+        return state
+
+    def set_marker_effects(self, coef, X_mean):
+        self.coef_ = np.asarray(coef, dtype=np.float64)
+        self.X_mean_ = np.asarray(X_mean, dtype=np.float64)
+        self.intercept_ = self.y_mean_ - np.dot(self.X_mean_, self.coef_)
+        return self
+
+    def _fit_path(self, s2, U, yc):
+        """由 XcXcᵀ 的特征分解计算整条 alpha 路径的留一 / GCV 误差并选择 alpha"""
+        n_samples = len(yc)
+        keep = s2 > s2.max() * 1e-10
+        s2, U = s2[keep], U[:, keep]
+
+        alphas = self.alphas
+        if alphas is None:
+            alphas = np.logspace(-3, 3, 61) * s2.mean()
+        self.alphas_ = np.asarray(alphas, dtype=np.float64)
+
+        # 整条路径：F[k, j] = s_k² / (s_k² + α_j)
+        Uty = np.dot(U.T, yc)
+        F = s2[:, None] / (s2[:, None] + self.alphas_[None, :])
+        fitted = np.dot(U, F * Uty[:, None])
+        hat_diag = 1 / n_samples + np.dot(U ** 2, F)
+        resid = yc[:, None] - fitted
+        self.loo_mse_ = np.mean((resid / (1 - hat_diag)) ** 2, axis=0)
+        self.gcv_ = n_samples * np.sum(resid ** 2, axis=0) / (n_samples - 1 - F.sum(axis=0)) ** 2
+
+        errors = self.loo_mse_ if self.criterion == "loo" else self.gcv_
+        best = int(np.argmin(errors))
+        self.alpha_ = self.alphas_[best]
+        self._U, self._s2, self._Uty = U, s2, Uty
+
+    def coef_path(self, alphas=None):
+        """任意 alpha 网格下的标记效应（p × len(alphas)），不需要重新分解"""
+        if self._Xc_t_U is None:
+            raise ValueError("由内积矩阵拟合或从模型包读取的模型只有所选 alpha 的标记效应")
+        alphas = self.alphas_ if alphas is None else np.asarray(alphas, dtype=np.float64)
+        return np.dot(self._Xc_t_U, self._Uty[:, None] / (self._s2[:, None] + alphas[None, :]))
+
+    def predict_path(self, X, alphas=None):
+        """任意 alpha 网格下的预测值（n × len(alphas)）"""
+        coefs = self.coef_path(alphas)
+        return blocked_dot(X, coefs) - np.dot(self.X_mean_, coefs) + self.y_mean_
+
+    def predict(self, X):
+        return blocked_dot(X, self.coef_) + self.intercept_
+
+
+# 支持多性状共享核矩阵求解的模型
+MULTI_TRAIT_MODELS = ("GBLUP", "rrBLUP", "KRR", "RKHS")
+
+
+class EigenSolver:
+    """在 K（或其观测行子矩阵）自身的特征分解上求解 (K + cI)⁻¹
+
+    loo_alpha 的留一残差对应预测 ȳ + K(K + αI)⁻¹(y − ȳ)，记 A = K + αI：
+    残差为 α·A⁻¹r，1 − h_i = α·((A⁻¹)_ii − (A⁻¹1)_i / m)；K 已中心化时与 RRBLUPModel 的留一误差相同，
+    观测行子矩阵未按观测行中心化，不能假定 K·1 = 0。
+    """
+
+    def __init__(self, eigvals, eigvecs):
+        self.eigvals, self.eigvecs = eigvals, eigvecs
+
+    def reml(self, y, lambda_param):
+        """返回 (δ, Vg, REML 负对数似然)"""
+        eigvals = self.eigvals + lambda_param
+        y_rot, x_rot = np.dot(self.eigvecs.T, y), self.eigvecs.sum(axis=0)
+        delta, vg = reml_delta(eigvals, y_rot, x_rot)
+        return delta, vg, reml_neg_loglik(eigvals, y_rot, x_rot, delta)
+
+    def loo_alpha(self, yc, alphas):
+        # 整条路径：W[k, j] = 1 / (λ_k + α_j)
+        W = 1 / (self.eigvals[:, None] + alphas[None, :])
+        V_rot = np.dot(self.eigvecs.T, np.column_stack([yc, np.ones(len(yc))]))
+        x = np.dot(self.eigvecs, W * V_rot[:, [0]])
+        ones = np.dot(self.eigvecs, W * V_rot[:, [1]])
+        diag = np.dot(self.eigvecs ** 2, W)
+        return alphas[int(np.argmin(np.mean((x / (diag - ones / len(yc))) ** 2, axis=0)))]
+
+    def solve(self, R, shift):
+        return np.dot(self.eigvecs, np.dot(self.eigvecs.T, R) / (self.eigvals + shift)[:, None])
+
+
+class MaskedSolver:
+    """在完整 K = UΛUᵀ 的特征基下求解观测行子矩阵 K_SS + cI，不重新分解（M 为缺失行）
+
+    记 A = K + cI，A⁻¹ = U·diag(w)·Uᵀ，w = 1 / (λ + c)，由分块求逆：
+    (A_SS)⁻¹ = (A⁻¹)_SS − (A⁻¹)_SM·C⁻¹·(A⁻¹)_MS，C = (A⁻¹)_MM，log|A_SS| = log|A| + log|C|。
+    每个 c 只需构造并分解 |M|×|M| 的 C，代价 O(n·|M|²)。
+    """
+
+    def __init__(self, eigvals, eigvecs, observed):
+        self.eigvals = eigvals
+        self.U_S, self.U_M = eigvecs[observed], eigvecs[~observed]
+
+    def _factor(self, d):
+        w = 1 / d
+        return w, linalg.cho_factor(np.dot(self.U_M * w, self.U_M.T), lower=True, check_finite=False)
+
+    def _apply(self, w, cho, V_rot):
+        """(A_SS)⁻¹·V 在特征基下的坐标，V_rot = U_Sᵀ·V"""
+        correction = linalg.cho_solve(cho, np.dot(self.U_M, w[:, None] * V_rot), check_finite=False)
+        return w[:, None] * (V_rot - np.dot(self.U_M.T, correction))
+
+    def reml(self, y, lambda_param):
+        eigvals = self.eigvals + lambda_param
+        V_rot = np.dot(self.U_S.T, np.column_stack([np.ones(len(y)), y]))
+        df = len(y) - 1
+
+        def terms(log_delta):
+            d = eigvals + 10 ** log_delta
+            w, cho = self._factor(d)
+            # Q = [1 y]ᵀ·(A_SS)⁻¹·[1 y]
+            Q = np.dot(V_rot.T, self._apply(w, cho, V_rot))
+            rhr = Q[1, 1] - Q[0, 1] ** 2 / Q[0, 0]
+            logdet = np.sum(np.log(d)) + 2 * np.sum(np.log(np.diag(cho[0])))
+            return 0.5 * (df * np.log(rhr / df) + logdet + np.log(Q[0, 0])), rhr
+
+        log_delta = search_log_delta(lambda v: terms(v)[0])
+        value, rhr = terms(log_delta)
+        return 10 ** log_delta, rhr / df, value
+
+    def loo_alpha(self, yc, alphas):
+        V_rot = np.dot(self.U_S.T, np.column_stack([yc, np.ones(len(yc))]))
+        U2 = self.U_S ** 2
+        loo_mse = np.empty(len(alphas))
+        for a, alpha in enumerate(alphas):
+            w, cho = self._factor(self.eigvals + alpha)
+            x, ones = np.dot(self.U_S, self._apply(w, cho, V_rot)).T
+            A_SM = np.dot(self.U_S * w, self.U_M.T)
+            diag = np.dot(U2, w) - np.einsum("ij,ji->i", A_SM, linalg.cho_solve(cho, A_SM.T, check_finite=False))
+            loo_mse[a] = np.mean((x / (diag - ones / len(yc))) ** 2)
+        return alphas[int(np.argmin(loo_mse))]
+
+    def solve(self, R, shift):
+        w, cho = self._factor(self.eigvals + shift)
+        return np.dot(self.U_S, self._apply(w, cho, np.dot(self.U_S.T, R)))
+
+
+def trait_patterns(Y):
+    """按缺失模式(NaN)对性状分组，返回 [(观测行号, 性状列号), ...]，有效表型少于 2 个的性状不参与求解"""
+    observed = ~np.isnan(Y)
+    patterns = {}
+    for j in range(Y.shape[1]):
+        patterns.setdefault(observed[:, j].tobytes(), []).append(j)
+    groups = [(np.flatnonzero(observed[:, cols[0]]), cols) for cols in patterns.values()]
+    return [(idx, cols) for idx, cols in groups if len(idx) >= 2]
+
+
+def kernel_solver(eigvals, eigvecs, K, idx, alpha=None, n_traits=1, n_alphas=0):
+    """K 的观测行 idx 上的求解器，K = eigvecs·diag(eigvals)·eigvecsᵀ 为已有的完整分解
+
+    没有缺失行时直接使用完整分解；缺失行较少时在完整特征基下求解（MaskedSolver），
+    对观测子矩阵单独分解（约 4m³）反而更便宜时才重新分解。alpha 与 solve_kernel_traits 相同，用于估计代价。
+    """
+    n, n_obs = len(eigvals), len(idx)
+    n_missing = n - n_obs
+    if n_missing == 0:
+        return EigenSolver(eigvals, eigvecs)
+    if alpha is None:
+        # 每个性状约 120 次似然计算，每次 O(n·|M|²)
+        cost = 120 * n_traits * n * n_missing ** 2
+    elif alpha == "loo":
+        # 每个 alpha 还需 (A_SS)⁻¹ 的对角线，O(n·|M|·(|M| + m))
+        cost = n_alphas * n_traits * n * n_missing * (n_missing + n_obs)
+    else:
+        cost = n * n_missing ** 2
+    if cost < 4 * n_obs ** 3:
+        observed = np.zeros(n, dtype=bool)
+        observed[idx] = True
+        return MaskedSolver(eigvals, eigvecs, observed)
+    sub_eigvals, sub_eigvecs = linalg.eigh(K[np.ix_(idx, idx)], check_finite=False)
+    return EigenSolver(np.clip(sub_eigvals, 0, None), sub_eigvecs)
+
+
+def solve_kernel_traits(K, Y, alpha=None, center=True, lambda_param=1e-6, alphas=None):
+    """在共享核矩阵 K 上同时求解多个性状的对偶系数
+
+    K 只做一次特征分解，所有性状共用；Y 中的缺失值(NaN)按性状屏蔽，有缺失的性状在同一特征基下
+    通过缺失行上的分块求逆求解（见 MaskedSolver），缺失比例高时才对该缺失模式的子矩阵单独分解。
+    alpha=None 时按性状 REML 估计收缩参数（GBLUP）；alpha="loo" 时与单性状 rrBLUP 相同，
+    在 alphas 网格（默认为平均特征值的 10⁻³~10³ 倍）上按留一误差逐性状选择；否则使用固定的岭参数。
+    返回 (coef, intercept, h2)，预测值为 K_cross·coef + intercept。
+    """
+    n_train, n_traits = Y.shape
+    coef = np.zeros((n_train, n_traits))
+    intercept = np.zeros(n_traits)
+    h2 = np.full(n_traits, np.nan)
+
+    eigvals, eigvecs = linalg.eigh(K, check_finite=False)
+    eigvals = np.clip(eigvals, 0, None)
+    if alpha == "loo" and alphas is None:
+        alphas = np.logspace(-3, 3, 61) * eigvals[eigvals > eigvals.max() * 1e-10].mean()
+
+    for idx, cols in trait_patterns(Y):
+        solver = kernel_solver(eigvals, eigvecs, K, idx, alpha, len(cols), 0 if alphas is None else len(alphas))
+        Y_sub = Y[np.ix_(idx, cols)]
+        mu = Y_sub.mean(axis=0) if center else np.zeros(len(cols))
+        R = Y_sub - mu
+
+        if alpha is None:
+            # Vg·K·V⁻¹ 中 Vg 相互抵消，只需 (K + (λ + δ)I)⁻¹
+            for c, j in enumerate(cols):
+                delta, _, _ = solver.reml(Y_sub[:, c], lambda_param)
+                h2[j] = 1 / (1 + delta)
+                coef[idx, j] = solver.solve(R[:, [c]], lambda_param + delta)[:, 0]
+        elif alpha == "loo":
+            for c, j in enumerate(cols):
+                coef[idx, j] = solver.solve(R[:, [c]], solver.loo_alpha(R[:, c], alphas))[:, 0]
+        else:
+            coef[np.ix_(idx, cols)] = solver.solve(R, alpha)
+        intercept[cols] = mu
+    return coef, intercept, h2
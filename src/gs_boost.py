@@ -0,0 +1,295 @@
+import lightgbm as lgb
+import numpy as np
+import xgboost as xgb
+from catboost import CatBoostRegressor, Pool
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.ensemble import GradientBoostingRegressor
+
+from gs_cache import MatrixCache
+
+BOOST_MODELS = ("CatBoost", "XGBoost", "LightGBM")
+# 早停：验证误差连续多少轮没有下降即停止
+EARLY_STOPPING_ROUNDS = 20
+
+# (库, 分箱数) -> 训练矩阵摘要 -> 量化数据集；同一训练集的不同性状、超参数和交叉验证训练折共用分箱结果
+_DATASET_CACHES = {}
+_DATASET_CACHE_SIZE = 4
+
+
+def _lightgbm_dataset(X, max_bin, n_jobs):
+    params = {"max_bin": max_bin, "verbose": -1, "feature_pre_filter": False, "num_threads": n_jobs}
+    return lgb.Dataset(X, label=np.zeros(len(X)), params=params, free_raw_data=False).construct()
+
+
+def _xgboost_dataset(X, max_bin, n_jobs, ref=None):
+    return xgb.QuantileDMatrix(X, label=np.zeros(len(X)), max_bin=max_bin, nthread=n_jobs, ref=ref)
+
+
+def _catboost_dataset(X, y, max_bin, n_jobs):
+    pool = Pool(X, label=y, thread_count=n_jobs)
+    pool.quantize(border_count=max_bin)
+    return pool
+
+
+class BoostData:
+    """一个训练矩阵的量化数据集（LightGBM Dataset / XGBoost QuantileDMatrix / CatBoost Pool）
+
+    基因型只有 0/1/2（加上填充值）几种取值，分箱只需做一次：行子集直接从最初构建的数据集切取
+    （LightGBM subset、CatBoost slice），XGBoost 以其分箱边界为参照重新映射，不再重新统计分位数。
+    """
+
+    def __init__(self, library, X, max_bin, n_jobs, root=None, idx=None):
+        self.library = library
+        self.X = X
+        self.max_bin = max_bin
+        self.n_jobs = n_jobs
+        # 切取子集时始终以最初构建的数据集为来源，避免子集的子集
+        self.root = root
+        self.idx = idx
+        # LightGBM 的 subset 按行号升序排列子集的行，order 记录本数据集各行在升序子集中的位置
+        self.order = None
+        self._data = None
+
+    def subset(self, idx, X):
+        if self.root is None:
+            return BoostData(self.library, X, self.max_bin, self.n_jobs, self, idx)
+        return BoostData(self.library, X, self.max_bin, self.n_jobs, self.root, self.idx[idx])
+
+    def _construct(self):
+        """构建（或从根数据集切取）不带标签的量化数据集"""
+        if self._data is None:
+            if self.library == "LightGBM":
+                sorted_idx = None if self.root is None else np.sort(self.idx)
+                if sorted_idx is None or np.any(np.diff(sorted_idx) == 0):
+                    # 根数据集，或子集中有重复行（同一父行被多次引用）时直接构建
+                    self._data = _lightgbm_dataset(self.X, self.max_bin, self.n_jobs)
+                else:
+                    # 切取的子集按行号升序排列，标签按相同的顺序设置（见 get）
+                    self.order = np.argsort(self.idx, kind="stable")
+                    self._data = self.root._construct().subset(sorted_idx).construct()
+            elif self.library == "XGBoost":
+                ref = None if self.root is None else self.root._construct()
+                self._data = _xgboost_dataset(self.X, self.max_bin, self.n_jobs, ref)
+            else:
+                raise ValueError(f"不支持的梯度提升库: {self.library}")
+        return self._data
+
+    def get(self, y):
+        """返回设置好标签的量化数据集"""
+        if self.library == "CatBoost":
+            # Pool 不能修改标签：子集从带完整标签的根数据集切取，标签不一致（换了性状）时重新构建
+            if self._data is None or not np.array_equal(self._data.get_label(), y):
+                if self.root is not None and self.root._data is not None and \
+                        np.array_equal(np.asarray(self.root._data.get_label())[self.idx], y):
+                    self._data = self.root._data.slice(self.idx)
+                else:
+                    self._data = _catboost_dataset(self.X, y, self.max_bin, self.n_jobs)
+            return self._data
+        data = self._construct()
+        data.set_label(y if self.order is None else y[self.order])
+        return data
+
+
+def boost_dataset(library, X, y, max_bin=16, n_jobs=1):
+    """按训练矩阵内容查找或构建量化数据集，X 是已缓存矩阵的行子集时直接切取"""
+    cache = _DATASET_CACHES.setdefault((library, max_bin), MatrixCache(_DATASET_CACHE_SIZE))
+    X = np.asarray(X, dtype=np.float32)
+    data = cache.get(X, lambda X, key: BoostData(library, X, max_bin, n_jobs),
+                     lambda parent, idx, X, key: parent.subset(idx, X))
+    return data.get(np.asarray(y, dtype=np.float64))
+
+
+def validation_split(n_samples, fraction, random_state=0, min_size=10):
+    """早停用的随机验证划分，返回 (训练行号, 验证行号)；任一部分少于 min_size 个样本时返回 None"""
+    n_val = int(round(n_samples * fraction))
+    if n_val < min_size or n_samples - n_val < min_size:
+        return None
+    perm = np.random.default_rng(random_state).permutation(n_samples)
+    return np.sort(perm[n_val:]), np.sort(perm[:n_val])
+
+
+class _CachedBoosting(BaseEstimator, RegressorMixin):
+    """训练数据取自 boost_dataset 的梯度提升模型基类；拟合后不保留数据集，模型可直接序列化
+
+    early_stopping_rounds 不为空时先留出 validation_fraction 的训练样本，验证误差连续 early_stopping_rounds
+    轮没有下降即停止，记录最优迭代次数 best_iteration_，再用全部训练样本按该次数重新拟合。
+    交叉验证中每折各自拟合模型，因此早停只使用该折的训练样本。
+    """
+
+    library = None
+    rounds_param = "n_estimators"
+
+    def _dataset(self, X, y):
+        return boost_dataset(self.library, X, y, self.max_bin, self.n_jobs)
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float64)
+        # 先构建全部样本的数据集，早停划分的两部分都从中切取
+        data = self._dataset(X, y)
+        n_rounds = getattr(self, self.rounds_param)
+        self.best_iteration_ = None
+        split = None
+        if self.early_stopping_rounds:
+            split = validation_split(len(y), self.validation_fraction, self.random_state)
+        if split is not None:
+            train_idx, val_idx = split
+            _, self.best_iteration_ = self._train(self._dataset(X[train_idx], y[train_idx]), n_rounds,
+                                                  (X[val_idx], y[val_idx]))
+            n_rounds = self.best_iteration_
+        self.booster_, _ = self._train(data, n_rounds)
+        self.n_iterations_ = n_rounds
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def predict(self, X):
+        return np.asarray(self._predict(np.asarray(X, dtype=np.float32)), dtype=np.float64)
+
+
+class LightGBMModel(_CachedBoosting):
+    library = "LightGBM"
+
+    def __init__(self, n_estimators=100, learning_rate=0.1, num_leaves=31, min_child_samples=20,
+                 colsample_bytree=1.0, max_bin=16, n_jobs=1, use_gpu=False, early_stopping_rounds=None,
+                 validation_fraction=0.2, random_state=0):
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.num_leaves = num_leaves
+        self.min_child_samples = min_child_samples
+        self.colsample_bytree = colsample_bytree
+        self.max_bin = max_bin
+        self.n_jobs = n_jobs
+        self.use_gpu = use_gpu
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def _train(self, data, n_rounds, valid=None):
+        params = {"objective": "regression", "learning_rate": self.learning_rate, "num_leaves": self.num_leaves,
+                  "min_data_in_leaf": self.min_child_samples, "feature_fraction": self.colsample_bytree,
+                  "num_threads": self.n_jobs, "device_type": "gpu" if self.use_gpu else "cpu", "verbose": -1}
+        if valid is None:
+            booster = lgb.train(params, data, num_boost_round=n_rounds)
+            booster.free_dataset()
+            return booster, None
+        booster = lgb.train(params, data, num_boost_round=n_rounds, valid_sets=[self._dataset(*valid)],
+                            callbacks=[lgb.early_stopping(self.early_stopping_rounds, verbose=False)])
+        booster.free_dataset()
+        return booster, max(1, booster.best_iteration)
+
+    def _predict(self, X):
+        return self.booster_.predict(X, num_threads=self.n_jobs)
+
+
+class XGBoostModel(_CachedBoosting):
+    library = "XGBoost"
+
+    def __init__(self, n_estimators=100, learning_rate=0.3, max_depth=6, subsample=1.0, colsample_bytree=1.0,
+                 max_bin=16, n_jobs=1, use_gpu=False, early_stopping_rounds=None, validation_fraction=0.2,
+                 random_state=0):
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.subsample = subsample
+        self.colsample_bytree = colsample_bytree
+        self.max_bin = max_bin
+        self.n_jobs = n_jobs
+        self.use_gpu = use_gpu
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def _train(self, data, n_rounds, valid=None):
+        params = {"objective": "reg:squarederror", "eta": self.learning_rate, "max_depth": self.max_depth,
+                  "subsample": self.subsample, "colsample_bytree": self.colsample_bytree, "max_bin": self.max_bin,
+                  "tree_method": "hist", "device": "cuda" if self.use_gpu else "cpu", "nthread": self.n_jobs,
+                  "seed": self.random_state}
+        if valid is None:
+            return xgb.train(params, data, num_boost_round=n_rounds), None
+        # 验证集必须以训练集为分箱参照
+        dvalid = xgb.QuantileDMatrix(valid[0], label=valid[1], max_bin=self.max_bin, ref=data, nthread=self.n_jobs)
+        booster = xgb.train(params, data, num_boost_round=n_rounds, evals=[(dvalid, "valid")],
+                            early_stopping_rounds=self.early_stopping_rounds, verbose_eval=False)
+        return booster, booster.best_iteration + 1
+
+    def _predict(self, X):
+        return self.booster_.inplace_predict(X)
+
+
+class CatBoostModel(_CachedBoosting):
+    library = "CatBoost"
+    rounds_param = "iterations"
+
+    def __init__(self, iterations=1000, learning_rate=None, depth=None, l2_leaf_reg=None, max_bin=16, n_jobs=1,
+                 use_gpu=False, early_stopping_rounds=None, validation_fraction=0.2, random_state=0):
+        self.iterations = iterations
+        self.learning_rate = learning_rate
+        self.depth = depth
+        self.l2_leaf_reg = l2_leaf_reg
+        self.max_bin = max_bin
+        self.n_jobs = n_jobs
+        self.use_gpu = use_gpu
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        self.learning_rate_ = self.learning_rate
+        return super().fit(X, y)
+
+    def _train(self, data, n_rounds, valid=None):
+        # 未指定的参数保持 CatBoost 的默认值（显式给出 l2_leaf_reg 会关闭学习率自动选择）
+        model = CatBoostRegressor(iterations=n_rounds, learning_rate=self.learning_rate_, depth=self.depth,
+                                  l2_leaf_reg=self.l2_leaf_reg, thread_count=self.n_jobs,
+                                  task_type="GPU" if self.use_gpu else "CPU", random_seed=self.random_state,
+                                  verbose=0, allow_writing_files=False)
+        if valid is None:
+            return model.fit(data), None
+        model.fit(data, eval_set=self._dataset(*valid), early_stopping_rounds=self.early_stopping_rounds,
+                  use_best_model=False)
+        # 自动学习率随迭代次数变化，重新拟合时沿用早停时的学习率
+        self.learning_rate_ = model.learning_rate_
+        return model, model.get_best_iteration() + 1
+
+    def _predict(self, X):
+        return self.booster_.predict(X, thread_count=self.n_jobs)
+
+
+class GBDTModel(_CachedBoosting):
+    """sklearn 梯度提升树，没有可复用的量化数据集，早停时逐轮累加验证集预测"""
+
+    def __init__(self, n_estimators=100, learning_rate=0.1, max_depth=3, subsample=1.0, early_stopping_rounds=None,
+                 validation_fraction=0.2, random_state=0):
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.subsample = subsample
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def _dataset(self, X, y):
+        return X, y
+
+    def _train(self, data, n_rounds, valid=None):
+        model = GradientBoostingRegressor(n_estimators=n_rounds, learning_rate=self.learning_rate,
+                                          max_depth=self.max_depth, subsample=self.subsample,
+                                          random_state=self.random_state)
+        if valid is None:
+            return model.fit(*data), None
+        X_val, y_val = valid
+        losses = []
+        state = {}
+
+        def monitor(i, estimator, _):
+            if "pred" not in state:
+                state["pred"] = np.asarray(estimator.init_.predict(X_val), dtype=np.float64).ravel()
+            state["pred"] += estimator.learning_rate * estimator.estimators_[i, 0].predict(X_val)
+            losses.append(np.mean((y_val - state["pred"]) ** 2))
+            return i - int(np.argmin(losses)) >= self.early_stopping_rounds
+
+        model.fit(*data, monitor=monitor)
+        return model, int(np.argmin(losses)) + 1
+
+    def _predict(self, X):
+        return self.booster_.predict(X)
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from gs import iter_vcf_blocks
+
+BUNDLE_VERSION = 1
+
+
+def build_bundle(metrics, markers, gs_args):
+    """由一次训练的结果构建模型包：模型、标记筛选掩码、标记 ID 与等位基因编码、训练集标记均值及训练元数据"""
+    model_instance = metrics["model"]
+    if "progress" in model_instance.get_params():
+        # 进度回调与界面线程绑定，不能序列化
+        model_instance.set_params(progress=None)
+    support = np.asarray(metrics["support"], dtype=bool)
+    selected = markers.loc[support].reset_index(drop=True)
+    return {
+        "version": BUNDLE_VERSION,
+        "model": model_instance,
+        "support": support,
+        "marker_ids": selected["ID"].tolist(),
+        "ref": selected["REF"].tolist(),
+        "alt": selected["ALT"].tolist(),
+        "marker_means": np.asarray(metrics["marker_means"], dtype=np.float64),
+        "imputer": metrics["imputer"].subset(support) if "imputer" in metrics else None,
+        "metadata": {
+            "model": gs_args["models"],
+            "trait": gs_args["trait"],
+            "geno_file": gs_args["geno_file"],
+            "pheno_file": gs_args["pheno_file"],
+            "n_train": int(metrics["n_train"]),
+            "n_markers": int(support.sum()),
+            "PCC": float(metrics["PCC"]),
+            "R²": float(metrics["R²"]),
+            "RMSE": float(metrics["RMSE"]),
+            "h2": None if metrics["h2"] is None else float(metrics["h2"]),
+            "best_params": metrics["tuning"].best_params_ if "tuning" in metrics else None,
+            "best_iteration": metrics.get("best_iteration"),
+            "threads": metrics.get("threads"),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+    }
+
+
+def save_bundle(bundle, save_path="model_bundle.joblib"):
+    try:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        joblib.dump(bundle, save_path)
+        print(f"成功保存模型至：{os.path.abspath(save_path)}")
+        return True
+    except Exception as e:
+        print(f"保存模型失败：{str(e)}")
+        return False
+
+
+def load_bundle(bundle_file):
+    try:
+        bundle = joblib.load(bundle_file)
+    except Exception as e:
+        raise ValueError(f"读取模型文件时发生错误: {str(e)}")
+    if not isinstance(bundle, dict) or bundle.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"不支持的模型文件: {bundle_file}")
+    return bundle
+
+
+def match_markers(bundle, markers):
+    """在新文件的标记表中定位模型包的各个标记，返回 (列位置, 是否翻转)；位置为 -1 表示新文件中缺少该标记"""
+    positions = pd.Index(markers["ID"]).get_indexer(bundle["marker_ids"])
+    found = positions >= 0
+    new_ref = markers["REF"].to_numpy()[positions[found]]
+    new_alt = markers["ALT"].to_numpy()[positions[found]]
+    ref = np.asarray(bundle["ref"])[found]
+    alt = np.asarray(bundle["alt"])[found]
+    flipped = np.zeros(len(positions), dtype=bool)
+    flipped[found] = (new_ref == alt) & (new_alt == ref)
+    return positions, flipped
+
+
+def align_genotypes(bundle, genotypes, markers, matched=None):
+    """按标记 ID 将新基因型对齐到模型包中的标记顺序
+
+    REF/ALT 与训练时相反的标记翻转剂量(2 - d)。新文件中缺少的标记及缺失的基因型(-1)按训练时的填充方法填充，
+    旧模型包没有保存填充参数时用训练集均值填充。
+    matched 为 match_markers 的结果，同一标记表的多批数据可以复用。返回 (对齐后的矩阵, 对齐报告)。
+    """
+    positions, flipped = match_markers(bundle, markers) if matched is None else matched
+    found = positions >= 0
+    genotypes = np.asarray(genotypes, dtype=np.float64)
+
+    X = np.full((genotypes.shape[0], len(positions)), -1.0)
+    X[:, found] = genotypes[:, positions[found]]
+
+    missing_calls = X[:, found] < 0
+    X[:, flipped] = np.where(X[:, flipped] < 0, X[:, flipped], 2 - X[:, flipped])
+    imputer = bundle.get("imputer")
+    if imputer is not None:
+        X = imputer.transform(X)
+    else:
+        missing = X < 0
+        X[missing] = np.broadcast_to(bundle["marker_means"], X.shape)[missing]
+
+    report = {"n_markers": len(positions), "n_missing_markers": int((~found).sum()),
+              "n_flipped": int(flipped.sum()), "n_missing_calls": int(missing_calls.sum())}
+    return X, report
+
+
+def predict_with_bundle(bundle, genotypes, markers):
+    X, report = align_genotypes(bundle, genotypes, markers)
+    return bundle["model"].predict(X), report
+
+
+def stream_predict_with_bundle(bundle, vcf_file, save_path="GEBV.csv", block_size=1000, progress=None):
+    """对大规模候选群体逐块预测：按样本块解码 VCF、对齐并预测，GEBV 逐块追加写入结果文件
+
+    标记匹配只在第一块计算一次。返回汇总的对齐报告（含样本数）。
+    """
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    report, matched = None, None
+    with open(save_path, "w", newline="", encoding="utf-8") as f:
+        f.write("SampleID,GEBV\n")
+        for sample_ids, genotypes, markers in iter_vcf_blocks(vcf_file, block_size):
+            if matched is None:
+                matched = match_markers(bundle, markers)
+            X, block_report = align_genotypes(bundle, genotypes, markers, matched)
+            gebv = bundle["model"].predict(X)
+            pd.DataFrame({"SampleID": sample_ids, "GEBV": gebv}).to_csv(f, header=False, index=False)
+            if report is None:
+                report = dict(block_report, n_samples=0)
+            else:
+                report["n_missing_calls"] += block_report["n_missing_calls"]
+            report["n_samples"] += len(sample_ids)
+            if progress is not None:
+                progress(f"已预测 {report['n_samples']} 个样本")
+    print(f"成功保存预测结果至：{os.path.abspath(save_path)}")
+    return report
@@ -0,0 +1,63 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+def matrix_digest(X):
+    """矩阵内容（含形状和类型）的摘要"""
+    h = hashlib.sha1(str((X.shape, X.dtype.str)).encode())
+    h.update(np.ascontiguousarray(X).view(np.uint8))
+    return h.hexdigest()
+
+
+def row_digests(X):
+    return [hashlib.sha1(row.tobytes()).digest() for row in np.ascontiguousarray(X)]
+
+
+class MatrixCache:
+    """按训练矩阵内容缓存派生对象（核矩阵、量化数据集等）的 LRU 缓存
+
+    查找未命中时，若 X 是某个已缓存矩阵的行子集（列和类型完全相同，如交叉验证的训练折、
+    超参数搜索中的部分样本），由 subset(父对象, 行号, X, 摘要) 从父对象切取，否则由 build(X, 摘要) 构建。
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._entries = OrderedDict()
+        self._row_index = {}
+
+    def get(self, X, build, subset=None):
+        X = np.asarray(X)
+        key = matrix_digest(X)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+        value = None
+        if subset is not None:
+            value = self._from_parent(X, key, subset)
+        if value is None:
+            value = build(X, key)
+        self._entries[key] = (X, value)
+        while len(self._entries) > self.size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._row_index.pop(old_key, None)
+        return value
+
+    def _from_parent(self, X, key, subset):
+        parents = [k for k, (P, _) in self._entries.items()
+                   if P.shape[1] == X.shape[1] and P.dtype == X.dtype and P.shape[0] > X.shape[0]]
+        if not parents:
+            return None
+        digests = row_digests(X)
+        for parent_key in reversed(parents):
+            if parent_key not in self._row_index:
+                P = self._entries[parent_key][0]
+                self._row_index[parent_key] = {d: i for i, d in enumerate(row_digests(P))}
+            index = self._row_index[parent_key]
+            idx = [index.get(d) for d in digests]
+            if None not in idx:
+                self._entries.move_to_end(parent_key)
+                return subset(self._entries[parent_key][1], np.array(idx), X, key)
+        return None
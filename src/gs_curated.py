@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from gs import read_vcf, get_pheno_matrix, genomic_selections, parse_json_from_file
+from gs_bundle import build_bundle, save_bundle, load_bundle, align_genotypes
+from gs_grm import IncrementalGRM, IncrementalGBLUP
+from gs_models import MODEL_ALIASES
+
+
+def find_curated_bundle(population, trait, model):
+    """查找群体中某性状、某模型的预构建模型包，不存在时返回 None"""
+    model = MODEL_ALIASES.get(model, model)
+    bundle_file = population.get("models", {}).get(trait, {}).get(model)
+    if bundle_file and os.path.isfile(bundle_file):
+        return bundle_file
+    return None
+
+
+def save_grm(save_path, sample_ids, X, markers=None):
+    """计算并缓存参考群体的 G 矩阵，连同标准化参数和紧凑基因型，之后新增样本时可增量扩展"""
+    marker_info = {}
+    if markers is not None:
+        marker_info = {"marker_ids": markers["ID"].tolist(), "ref": markers["REF"].tolist(),
+                       "alt": markers["ALT"].tolist()}
+    grm = IncrementalGRM().fit(np.asarray(X), sample_ids, **marker_info)
+    grm.save(save_path)
+    return grm
+
+
+def extend_grm(grm_file, geno_file, progress=print):
+    """把新基因型文件中的样本追加到已缓存的 G 矩阵：只计算新样本的 G 行列，已有样本跳过
+
+    新文件的标记按 ID 对齐到参考标记（REF/ALT 相反时翻转剂量），新文件中缺少的标记和缺失的基因型
+    按参考群体的标记均值填充。
+    """
+    grm = IncrementalGRM.load(grm_file)
+    ids, geno_data, markers = read_vcf(geno_file, None, return_markers=True)
+    new = [i for i, sample in enumerate(ids) if str(sample) not in grm.index]
+    if not new:
+        progress(f"{geno_file} 中的样本均已在 G 矩阵中")
+        return grm
+    genotypes = np.asarray(geno_data)[new]
+    if grm.marker_ids_ is not None:
+        # 缺失保持为 -1，由 IncrementalGRM 按参考群体均值填充
+        reference = {"marker_ids": grm.marker_ids_, "ref": grm.ref_, "alt": grm.alt_,
+                     "marker_means": np.full(grm.n_markers, -1.0), "imputer": None}
+        genotypes, report = align_genotypes(reference, genotypes, markers)
+        progress(f"标记对齐：缺失 {report['n_missing_markers']} 个，等位基因翻转 {report['n_flipped']} 个")
+    grm.add(genotypes, [ids[i] for i in new])
+    grm.save(grm_file)
+    progress(f"G 矩阵新增样本 {len(new)} 个，共 {len(grm.sample_ids_)} 个")
+    return grm
+
+
+def serve_gblup(bundle, gblup):
+    """用 G 矩阵上的 GBLUP 反解出的标记效应替换模型包中的模型，标记表与填充参数改为 G 矩阵的参考标记与均值"""
+    grm = gblup.grm
+    bundle["model"] = gblup.marker_model()
+    bundle["support"] = np.ones(grm.n_markers, dtype=bool)
+    bundle["marker_ids"], bundle["ref"], bundle["alt"] = list(grm.marker_ids_), list(grm.ref_), list(grm.alt_)
+    # 缺失基因型按参考群体均值填充，与 G 矩阵的标准化一致
+    bundle["marker_means"], bundle["imputer"] = np.asarray(grm.means_, dtype=np.float64), None
+    bundle["metadata"].update(n_train=len(gblup.train_ids_), n_markers=grm.n_markers,
+                              h2=float(gblup.model_.h2_), updated=datetime.now().isoformat(timespec="seconds"))
+    return bundle
+
+
+def read_new_phenotypes(phenotype_file):
+    """读取新表型文件，行索引为字符串形式的样本 ID"""
+    sep = "," if phenotype_file.endswith('.csv') else "\t"
+    pheno = pd.read_csv(phenotype_file, sep=sep, index_col=0)
+    pheno.index = pheno.index.astype(str)
+    return pheno.apply(pd.to_numeric, errors="coerce")
+
+
+def update_curated_population(population, geno_file, pheno_file=None, progress=print):
+    """把新一批样本加入已构建的群体：新基因型追加到 G 矩阵，有表型的新样本加入各性状的 GBLUP 训练集
+
+    G 矩阵只计算新样本的行列，GBLUP 的 Cholesky 因子分块更新，方差组分沿用参考拟合的估计值；
+    之后重新反解标记效应并覆盖群体的 GBLUP 模型包，预测服务加载到的即为更新后的模型。
+    """
+    grm = extend_grm(population["grm"], geno_file, progress)
+    if pheno_file is None:
+        return
+    pheno = read_new_phenotypes(pheno_file)
+    for trait, state_file in population.get("gblup", {}).items():
+        if trait not in pheno.columns:
+            continue
+        gblup = IncrementalGBLUP.load(state_file, grm)
+        trained = set(gblup.train_ids_)
+        values = pheno[trait].dropna()
+        values = values[~values.index.isin(trained)]
+        genotyped = values.index.isin(list(grm.index))
+        if not genotyped.all():
+            progress(f"{trait}: {int((~genotyped).sum())} 个有表型的样本不在 G 矩阵中，已跳过")
+        values = values[genotyped]
+        if values.empty:
+            continue
+        gblup.add_training(values.index.tolist(), values.to_numpy())
+        gblup.save(state_file)
+        bundle_file = population["models"][trait]["GBLUP"]
+        save_bundle(serve_gblup(load_bundle(bundle_file), gblup), bundle_file)
+        progress(f"{trait} GBLUP: 训练集新增 {len(values)} 个样本，共 {len(gblup.train_ids_)} 个")
+
+
+def build_curated_models(config_file, out_dir, models=("GBLUP",), threads=1, cv_folds=5, progress=print):
+    """离线为 curated_models.json 中每个群体的每个性状构建模型包，并把路径写回配置文件
+
+    同一群体的参考基因型只读取一次，G 矩阵缓存为 grm.npz。GBLUP 在 G 矩阵上拟合并保存状态，
+    之后的新样本由 update_curated_population 增量加入；模型包保存反解后的标记效应，
+    预测时只需对用户的基因型做一次矩阵-向量乘积。GBLUP 使用全部标记（与 G 矩阵一致），交叉验证精度也按全部标记评估。
+    """
+    config = parse_json_from_file(config_file)
+    for specie in config["curated_models"]:
+        for population in specie["populations"]:
+            name = f"{specie['specie']}_{population['population']}"
+            pop_dir = os.path.join(out_dir, name)
+            progress(f"构建群体 {name} 的预构建模型")
+
+            ids, geno_data, markers = read_vcf(population["geno"], None, return_markers=True)
+            pheno = get_pheno_matrix(population["phe"], None, ids)
+            grm_file = os.path.join(pop_dir, "grm.npz")
+            grm = save_grm(grm_file, ids, geno_data, markers)
+            population["grm"] = grm_file
+
+            geno_arr = np.asarray(geno_data)
+            population.setdefault("models", {})
+            for trait in pheno.columns:
+                observed = pheno[trait].notna().to_numpy()
+                y = pheno.loc[observed, trait].tolist()
+                for model in (MODEL_ALIASES.get(m, m) for m in models):
+                    metrics = genomic_selections(geno_arr[observed], y, model, threads, False, None, None, None,
+                                                 cv_folds=cv_folds, k="all" if model == "GBLUP" else 40000)
+                    gs_args = {"models": model, "trait": trait, "geno_file": population["geno"],
+                               "pheno_file": population["phe"]}
+                    bundle_file = os.path.join(pop_dir, f"{trait}_{model}.joblib")
+                    bundle = build_bundle(metrics, markers, gs_args)
+                    if model == "GBLUP":
+                        gblup = IncrementalGBLUP(grm).fit(np.asarray(ids)[observed], y)
+                        state_file = os.path.join(pop_dir, f"{trait}_GBLUP.npz")
+                        gblup.save(state_file)
+                        population.setdefault("gblup", {})[trait] = state_file
+                        bundle = serve_gblup(bundle, gblup)
+                    save_bundle(bundle, bundle_file)
+                    population["models"].setdefault(trait, {})[model] = bundle_file
+                    progress(f"{name} {trait} {model}: PCC={metrics['PCC']:.3f}")
+
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="为精选群体离线构建预测模型")
+    parser.add_argument("--config", default="../config/curated_models.json")
+    parser.add_argument("--out-dir", default="../config/models")
+    parser.add_argument("--models", nargs="+", default=["GBLUP"])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--cv-folds", type=int, default=5)
+    parser.add_argument("--population", help="已构建的群体名（物种_群体），与 --add-geno 一起使用")
+    parser.add_argument("--add-geno", help="把该 VCF 中新基因型的样本追加到 --population 的 G 矩阵")
+    parser.add_argument("--add-phe", help="新样本的表型文件，有表型的样本加入 GBLUP 训练集并更新模型包")
+    args = parser.parse_args()
+    if args.add_geno:
+        if not args.population:
+            parser.error("--add-geno 需要同时指定 --population")
+        config = parse_json_from_file(args.config)
+        populations = {f"{specie['specie']}_{population['population']}": population
+                       for specie in config["curated_models"] for population in specie["populations"]}
+        if args.population not in populations or "grm" not in populations[args.population]:
+            parser.error(f"配置中没有已构建的群体: {args.population}")
+        update_curated_population(populations[args.population], args.add_geno, args.add_phe)
+    else:
+        build_curated_models(args.config, args.out_dir, args.models, args.threads, args.cv_folds)
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score, mean_squared_error
+from sklearn.model_selection import RepeatedKFold
+
+from gs_models import create_model
+from gs_precision import as_work
+from gs_screen import MarkerSelector
+from gs_shared import attach_genotypes, publish_genotypes
+from gs_threads import limit_threads
+
+
+def _run_fold(task):
+    X = attach_genotypes(task["geno"])
+    y = task["y"]
+    train_idx, test_idx = task["train_idx"], task["test_idx"]
+    # 每折单独做标记筛选，避免测试集信息泄漏；筛选在紧凑矩阵上进行，只有保留的标记转换为 float32
+    selector = MarkerSelector(k=task["k"], p_value=task["p_value"]).fit(X[train_idx], y[train_idx])
+    support = selector.get_support()
+    x_train = as_work(X[np.ix_(train_idx, support)])
+    x_test = as_work(X[np.ix_(test_idx, support)])
+
+    model_instance = create_model(task["model"], task["threads"], task["use_gpu"])
+    model_instance.set_params(**task["params"])
+    model_instance.fit(x_train, y[train_idx])
+    pred = model_instance.predict(x_test)
+
+    y_test = y[test_idx]
+    return {
+        "repeat": task["repeat"],
+        "fold": task["fold"],
+        "PCC": np.corrcoef(y_test, pred)[0, 1],
+        "R²": r2_score(y_test, pred),
+        "RMSE": np.sqrt(mean_squared_error(y_test, pred)),
+        "best_iteration": getattr(model_instance, "best_iteration_", None),
+        "test_idx": test_idx,
+        "pred": pred,
+    }
+
+
+def cross_validate(genotypes, phenotypic_data, model, n_splits=5, n_repeats=1, threads=1, use_gpu=False,
+                   k=40000, random_state=0, progress=None, params=None, p_value=None):
+    """重复 k 折交叉验证：各折在进程池中并行，基因型矩阵通过共享内存只读共享
+
+    genotypes 可以是数组或已发布的 SharedGenotypes。返回各折的 R²/PCC/RMSE 以及袋外(out-of-fold)预测值（多次重复时取平均）。
+    """
+    y = np.asarray(phenotypic_data, dtype=np.float64)
+    # 已发布到共享内存的基因型（SharedGenotypes）直接使用，否则在此发布一次，结束时释放
+    with publish_genotypes(genotypes) as shared:
+        splits = list(RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats,
+                                    random_state=random_state).split(shared.X))
+
+        # 线程预算在并行的折之间分配
+        n_workers = max(1, min(len(splits), threads, os.cpu_count() or 1))
+        fold_threads = max(1, threads // n_workers)
+
+        tasks = [{
+            "geno": shared.desc, "y": y, "train_idx": train_idx, "test_idx": test_idx,
+            "model": model, "params": params or {}, "k": k, "p_value": p_value, "threads": fold_threads, "use_gpu": use_gpu,
+            "repeat": i // n_splits, "fold": i % n_splits,
+        } for i, (train_idx, test_idx) in enumerate(splits)]
+
+        results = []
+        if n_workers == 1:
+            for task in tasks:
+                results.append(_run_fold(task))
+                if progress is not None:
+                    progress(f"交叉验证完成 {len(results)}/{len(tasks)} 折")
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=limit_threads,
+                                     initargs=(fold_threads,)) as executor:
+                for future in as_completed([executor.submit(_run_fold, task) for task in tasks]):
+                    results.append(future.result())
+                    if progress is not None:
+                        progress(f"交叉验证完成 {len(results)}/{len(tasks)} 折")
+
+    oof_sum = np.zeros(len(y))
+    oof_count = np.zeros(len(y))
+    for result in results:
+        oof_sum[result["test_idx"]] += result["pred"]
+        oof_count[result["test_idx"]] += 1
+
+    keys = ("repeat", "fold", "PCC", "R²", "RMSE")
+    if any(result["best_iteration"] is not None for result in results):
+        # 梯度提升模型记录每折训练集内早停得到的迭代次数
+        keys += ("best_iteration",)
+    folds = sorted(({key: result[key] for key in keys} for result in results),
+                   key=lambda row: (row["repeat"], row["fold"]))
+    return {"folds": folds, "oof": oof_sum / np.maximum(oof_count, 1)}
+
+
+def save_cv_folds(folds, save_path="cv_folds.csv"):
+    try:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        pd.DataFrame(folds).to_csv(save_path, index=False)
+        print(f"成功保存交叉验证结果至：{os.path.abspath(save_path)}")
+        return True
+    except Exception as e:
+        print(f"保存交叉验证结果失败：{str(e)}")
+        return False
@@ -0,0 +1,241 @@
+import os
+
+import numpy as np
+
+from gs_blup import GBLUPModel
+from gs_impute import marker_statistics
+from gs_precision import BLOCK_SIZE, blocked_products
+from gs_shared import compact_genotypes
+
+
+class IncrementalGRM:
+    """可增量扩展的基因组关系矩阵 G = ZZᵀ/p
+
+    标准化参数（标记均值、标准差）由参考群体确定后固定，之后新增一批样本时只按标记块计算新样本与已有样本的
+    交叉内积（n×b）和新样本之间的内积（b×b），计算量为 O((n + b)·b·p)，已有的 n×n 部分不重新计算。
+    基因型以紧凑的 int8 保存（缺失为 -1，按参考群体的标记均值填充，即标准化后为 0），用于之后批次的交叉内积。
+    基因型与 G 存放在按容量倍增预分配的缓冲区中，新批次直接写入空余的行列，genotypes_ / G_ 为已填充部分的视图。
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+
+    def fit(self, X, sample_ids, marker_ids=None, ref=None, alt=None):
+        X = compact_genotypes(X)
+        if len(sample_ids) != X.shape[0]:
+            raise ValueError(f"样本 ID 数量({len(sample_ids)})与基因型行数({X.shape[0]})不一致")
+        self.sample_ids_ = [str(i) for i in sample_ids]
+        self.marker_ids_ = None if marker_ids is None else [str(i) for i in marker_ids]
+        self.ref_, self.alt_ = ref, alt
+        self.means_, _, _ = marker_statistics(X)
+        # 与 StandardScaler 一致：总体标准差，零方差标记的尺度为 1
+        self.scales_ = np.ones(X.shape[1])
+        for start in range(0, X.shape[1], self.block_size):
+            cols = slice(start, start + self.block_size)
+            filled = np.where(X[:, cols] < 0, self.means_[cols], X[:, cols])
+            self.scales_[cols] = filled.std(axis=0)
+        self.scales_[self.scales_ == 0] = 1.0
+
+        G = np.zeros((X.shape[0], X.shape[0]))
+        for _, Z in self._standardized_blocks(X):
+            G += blocked_products(Z, Z)
+        self._genotypes, self._G = X, G / X.shape[1]
+        self._index = None
+        return self
+
+    @property
+    def n_samples(self):
+        return len(self.sample_ids_)
+
+    @property
+    def n_markers(self):
+        return self._genotypes.shape[1]
+
+    @property
+    def genotypes_(self):
+        return self._genotypes[:self.n_samples]
+
+    @property
+    def G_(self):
+        return self._G[:self.n_samples, :self.n_samples]
+
+    def _reserve(self, n_total, dtype):
+        """保证缓冲区至少容纳 n_total 个样本，不足时按容量倍增重新分配；含小数剂量的批次使存储提升为 float32"""
+        dtype = np.promote_types(self._genotypes.dtype, dtype)
+        if n_total <= self._genotypes.shape[0] and dtype == self._genotypes.dtype:
+            return
+        n = self.n_samples
+        capacity = max(n_total, 2 * self._genotypes.shape[0])
+        genotypes = np.empty((capacity, self.n_markers), dtype=dtype)
+        genotypes[:n] = self.genotypes_
+        G = np.empty((capacity, capacity))
+        G[:n, :n] = self.G_
+        self._genotypes, self._G = genotypes, G
+
+    def _standardized_blocks(self, X):
+        """逐标记块产出 (列范围, 按参考群体标准化的 float32 块)"""
+        means, scales = self.means_.astype(np.float32), self.scales_.astype(np.float32)
+        for start in range(0, X.shape[1], self.block_size):
+            cols = slice(start, start + self.block_size)
+            block = np.asarray(X[:, cols], dtype=np.float32)
+            block = np.where(block < 0, means[cols], block)
+            yield cols, (block - means[cols]) / scales[cols]
+
+    def add(self, X_new, sample_ids):
+        """追加一批新基因型样本：只计算新的 G 行列，返回新样本在 G 中的位置"""
+        X_new = compact_genotypes(X_new)
+        sample_ids = [str(i) for i in sample_ids]
+        if X_new.shape != (len(sample_ids), self.n_markers):
+            raise ValueError(f"新样本基因型的形状{X_new.shape}与样本数({len(sample_ids)})或参考标记数({self.n_markers})不一致")
+        duplicated = [i for i in sample_ids if i in self.index]
+        if duplicated or len(set(sample_ids)) < len(sample_ids):
+            raise ValueError(f"新样本与已有样本重复: {', '.join((duplicated or sample_ids)[:5])}")
+
+        n, b = self.n_samples, len(sample_ids)
+        cross = np.zeros((n, b))
+        new = np.zeros((b, b))
+        new_blocks = self._standardized_blocks(X_new)
+        for (_, Z_old), (_, Z_new) in zip(self._standardized_blocks(self.genotypes_), new_blocks):
+            cross += blocked_products(Z_old, Z_new)
+            new += blocked_products(Z_new, Z_new)
+
+        self._reserve(n + b, X_new.dtype)
+        G = self._G
+        G[:n, n:n + b] = cross / self.n_markers
+        G[n:n + b, :n] = G[:n, n:n + b].T
+        G[n:n + b, n:n + b] = new / self.n_markers
+        self._genotypes[n:n + b] = X_new
+        self.sample_ids_ += sample_ids
+        self._index = None
+        return np.arange(n, n + b)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {sample: i for i, sample in enumerate(self.sample_ids_)}
+        return self._index
+
+    def positions(self, sample_ids):
+        missing = [str(i) for i in sample_ids if str(i) not in self.index]
+        if missing:
+            raise ValueError(f"G 矩阵中缺少样本: {', '.join(missing[:5])}")
+        return np.array([self.index[str(i)] for i in sample_ids], dtype=np.int64)
+
+    def submatrix(self, row_ids, col_ids):
+        return self.G_[np.ix_(self.positions(row_ids), self.positions(col_ids))]
+
+    def t_dot(self, sample_ids, w):
+        """按标记块计算 Zᵀw，Z 为指定样本按参考群体标准化的基因型"""
+        rows = self.genotypes_[self.positions(sample_ids)]
+        result = np.empty(self.n_markers)
+        for cols, Z in self._standardized_blocks(rows):
+            result[cols] = np.dot(Z.T, w)
+        return result
+
+    def save(self, save_path):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+            markers = {} if self.marker_ids_ is None else {"marker_ids": np.asarray(self.marker_ids_, dtype=str)}
+            if self.ref_ is not None:
+                markers.update(ref=np.asarray(self.ref_, dtype=str), alt=np.asarray(self.alt_, dtype=str))
+            np.savez(save_path, sample_ids=np.asarray(self.sample_ids_, dtype=str), means=self.means_,
+                     scales=self.scales_, genotypes=self.genotypes_, G=self.G_, **markers)
+            print(f"成功保存 G 矩阵至：{os.path.abspath(save_path)}")
+            return True
+        except Exception as e:
+            print(f"保存 G 矩阵失败：{str(e)}")
+            return False
+
+    @classmethod
+    def load(cls, grm_file):
+        try:
+            with np.load(grm_file) as data:
+                grm = cls()
+                grm.sample_ids_ = data["sample_ids"].tolist()
+                grm.means_, grm.scales_ = data["means"], data["scales"]
+                grm._genotypes, grm._G = data["genotypes"], data["G"]
+                grm.marker_ids_ = data["marker_ids"].tolist() if "marker_ids" in data else None
+                grm.ref_ = data["ref"].tolist() if "ref" in data else None
+                grm.alt_ = data["alt"].tolist() if "alt" in data else None
+        except Exception as e:
+            raise ValueError(f"读取 G 矩阵文件时发生错误: {str(e)}")
+        grm._index = None
+        return grm
+
+
+class IncrementalGBLUP:
+    """基于 IncrementalGRM 的 GBLUP
+
+    新基因型样本加入 G 后即可预测（只用到新的 G 行），不需要重新拟合；
+    新表型样本通过 add_training 加入训练集，方差组分保持参考拟合的估计值，
+    V 的 Cholesky 因子做分块更新，代价随批次大小增长，而不是重新分解整个训练集。
+    save / load 在两批样本之间保存拟合状态，marker_model 反解出模型包使用的标记效应模型。
+    """
+
+    def __init__(self, grm, h2="reml", lambda_param=1e-6):
+        self.grm = grm
+        self.h2 = h2
+        self.lambda_param = lambda_param
+
+    def fit(self, train_ids, y):
+        self.train_ids_ = [str(i) for i in train_ids]
+        G_train = self.grm.submatrix(self.train_ids_, self.train_ids_)
+        self.model_ = GBLUPModel(h2=self.h2, lambda_param=self.lambda_param, kernel="precomputed").fit(G_train, y)
+        return self
+
+    def add_training(self, sample_ids, y):
+        """追加一批有表型的训练样本（须已加入 G）"""
+        sample_ids = [str(i) for i in sample_ids]
+        K_train = None
+        if self.model_.cho_factor_ is None:
+            # REML 拟合在特征基下求解，首次追加时构造一次 Cholesky 因子
+            K_train = self.grm.submatrix(self.train_ids_, self.train_ids_)
+        self.model_.extend(self.grm.submatrix(sample_ids, self.train_ids_),
+                           self.grm.submatrix(sample_ids, sample_ids), y, K_train=K_train)
+        self.train_ids_ += sample_ids
+        return self
+
+    def predict(self, sample_ids):
+        return self.model_.predict(self.grm.submatrix(sample_ids, self.train_ids_))
+
+    def marker_model(self):
+        """反解为标记效应 û = Zᵀα·Vg/p，返回与 GBLUPModel(back_solve=True) 相同形式的模型，用于模型包"""
+        effects = self.model_.vg_ * self.grm.t_dot(self.train_ids_, self.model_.alpha_) / self.grm.n_markers
+        model = GBLUPModel(h2=self.h2, lambda_param=self.lambda_param, back_solve=True)
+        model.y_mean_, model.vg_, model.ve_, model.h2_ = (self.model_.y_mean_, self.model_.vg_, self.model_.ve_,
+                                                          self.model_.h2_)
+        model.scaler_, model.gebv_train_ = None, None
+        return model.set_marker_effects(effects, self.grm.means_, self.grm.scales_)
+
+    def save(self, save_path):
+        """保存训练集、方差组分与 Cholesky 因子（若已构造），下次追加训练样本时不需要重新拟合"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+            model = self.model_
+            factor = {} if model.cho_factor_ is None else {"cho_factor": model.cho_factor_[0]}
+            np.savez(save_path, train_ids=np.asarray(self.train_ids_, dtype=str), y_train=model.y_train_,
+                     alpha=model.alpha_, variance=np.array([model.vg_, model.ve_, model.h2_]), h2=str(self.h2),
+                     lambda_param=self.lambda_param, **factor)
+            print(f"成功保存 GBLUP 状态至：{os.path.abspath(save_path)}")
+            return True
+        except Exception as e:
+            print(f"保存 GBLUP 状态失败：{str(e)}")
+            return False
+
+    @classmethod
+    def load(cls, state_file, grm):
+        try:
+            with np.load(state_file) as data:
+                h2 = str(data["h2"])
+                gblup = cls(grm, h2 if h2 == "reml" else float(h2), float(data["lambda_param"]))
+                model = GBLUPModel(h2=gblup.h2, lambda_param=gblup.lambda_param, kernel="precomputed")
+                model.y_train_, model.alpha_ = data["y_train"], data["alpha"]
+                model.vg_, model.ve_, model.h2_ = data["variance"].tolist()
+                model.cho_factor_ = (data["cho_factor"], True) if "cho_factor" in data else None
+                gblup.train_ids_ = data["train_ids"].tolist()
+        except Exception as e:
+            raise ValueError(f"读取 GBLUP 状态文件时发生错误: {str(e)}")
+        model.y_mean_ = np.mean(model.y_train_)
+        model.scaler_, model.X_train_, model.marker_model_, model.gebv_train_ = None, None, None, None
+        gblup.model_ = model
+        return gblup
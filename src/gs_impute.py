@@ -0,0 +1,115 @@
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from gs_precision import WORK_DTYPE
+
+# 界面填充方法名称与 GenotypeImputer.method 的对应关系
+IMPUTE_METHODS = {"均值填充": "mean", "众数填充": "mode", "kNN 填充": "knn"}
+
+
+def marker_statistics(X, block_size=4096):
+    """按样本块一次扫描基因型矩阵，统计各标记的非缺失均值及 0/1/2 剂量计数（-1 视为缺失）"""
+    n_samples, n_markers = X.shape
+    sums = np.zeros(n_markers)
+    n_obs = np.zeros(n_markers, dtype=np.int64)
+    counts = np.zeros((3, n_markers), dtype=np.int64)
+    for start in range(0, n_samples, block_size):
+        block = np.asarray(X[start:start + block_size])
+        observed = block >= 0
+        sums += np.where(observed, block, 0).sum(axis=0, dtype=np.float64)
+        n_obs += observed.sum(axis=0)
+        for dosage in range(3):
+            counts[dosage] += np.count_nonzero(block == dosage, axis=0)
+    means = np.divide(sums, n_obs, out=np.zeros(n_markers), where=n_obs > 0)
+    return means, counts, n_obs
+
+
+def _knn_fill(X, missing, fill, n_neighbors, window, chunk_size=2048):
+    """LD 窗口内的 kNN 填充
+
+    标记按文件顺序划分为长度为 window 的窗口，在每个窗口内用矩阵乘法一次求出缺失样本与所有样本
+    在共同观测标记上的平均平方距离，缺失基因型取该标记有观测的 k 个最近样本的均值，没有供体时使用 fill。
+    """
+    n_samples, n_markers = X.shape
+    k = min(n_neighbors, n_samples - 1)
+    observed = ~missing
+    for start in range(0, n_markers, window):
+        cols = slice(start, start + window)
+        miss = missing[:, cols]
+        rows = np.flatnonzero(miss.any(axis=1))
+        if len(rows) == 0:
+            continue
+        if k < 1:
+            r_idx, c_idx = np.nonzero(miss)
+            X[r_idx, start + c_idx] = fill[start + c_idx]
+            continue
+
+        mask = observed[:, cols].astype(np.float64)
+        Xz = np.where(observed[:, cols], X[:, cols], 0.0)
+        sq = np.dot(mask[rows], (Xz ** 2).T) + np.dot(Xz[rows] ** 2, mask.T) - 2 * np.dot(Xz[rows], Xz.T)
+        shared = np.dot(mask[rows], mask.T)
+        dist = np.where(shared > 0, sq / np.maximum(shared, 1), np.inf)
+        dist[np.arange(len(rows)), rows] = np.inf
+
+        r_idx, c_idx = np.nonzero(miss[rows])
+        for lo in range(0, len(r_idx), chunk_size):
+            r, c = r_idx[lo:lo + chunk_size], start + c_idx[lo:lo + chunk_size]
+            # 只有在该标记上有观测的样本才能作为供体
+            d = np.where(observed[:, c].T, dist[r], np.inf)
+            nn = np.argpartition(d, k - 1, axis=1)[:, :k]
+            valid = np.isfinite(np.take_along_axis(d, nn, axis=1))
+            donors = np.where(valid, X[nn, c[:, None]], 0.0)
+            n_valid = valid.sum(axis=1)
+            X[rows[r], c] = np.where(n_valid > 0, donors.sum(axis=1) / np.maximum(n_valid, 1), fill[c])
+    return X
+
+
+class GenotypeImputer(BaseEstimator, TransformerMixin):
+    """基因型缺失值(-1)填充
+
+    mean / mode 使用训练群体各标记的非缺失均值 / 众数；knn 在 LD 窗口内用最近样本的均值填充，
+    找不到供体时退回训练群体均值。拟合得到的填充值随模型包保存，预测文件按同样的方式填充。
+    """
+
+    def __init__(self, method="mean", n_neighbors=5, window=50):
+        self.method = method
+        self.n_neighbors = n_neighbors
+        self.window = window
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        return self.fit_statistics(*marker_statistics(X), n_samples=X.shape[0])
+
+    def fit_statistics(self, means, counts, n_obs, n_samples):
+        """由 marker_statistics 的结果拟合（如按标记块流式统计的结果）"""
+        if self.method not in IMPUTE_METHODS.values():
+            raise ValueError(f"不支持的缺失填充方法: {self.method}")
+        self.n_missing_ = int(n_samples * len(n_obs) - n_obs.sum())
+        if self.method == "mode":
+            self.fill_ = np.argmax(counts, axis=0).astype(np.float64)
+        else:
+            self.fill_ = means
+        return self
+
+    def transform(self, X, block_size=4096):
+        """只填充缺失位置：整数剂量的众数填充保持 int8，均值 / kNN 填充为 float32，不生成 float64 副本"""
+        X = np.asarray(X)
+        integer = np.issubdtype(X.dtype, np.integer)
+        X = X.astype(np.int8 if self.method == "mode" and integer else WORK_DTYPE)
+        if self.method == "knn":
+            missing = X < 0
+            return _knn_fill(X, missing, self.fill_, self.n_neighbors, self.window) if missing.any() else X
+        fill = self.fill_.astype(X.dtype)
+        # 按样本块扫描，缺失掩码只占一个块
+        for start in range(0, X.shape[0], block_size):
+            block = X[start:start + block_size]
+            rows, cols = np.nonzero(block < 0)
+            block[rows, cols] = fill[cols]
+        return X
+
+    def subset(self, support):
+        """只保留 support 选中的标记，用于模型包"""
+        imputer = GenotypeImputer(self.method, self.n_neighbors, self.window)
+        imputer.fill_ = self.fill_[np.asarray(support)]
+        imputer.n_missing_ = self.n_missing_
+        return imputer
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.kernel_ridge import KernelRidge
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVR
+
+from gs_blup import GBLUPModel
+from gs_cache import MatrixCache
+from gs_precision import blocked_products, row_sq_norms
+
+KERNELS = ("linear", "rbf", "poly")
+KERNEL_ESTIMATORS = ("KRR", "SVR", "GBLUP")
+
+# 训练集基因型摘要 -> KernelCache；同一训练集的不同模型、不同超参数共用核矩阵
+_KERNEL_CACHE = MatrixCache(size=8)
+
+
+def apply_kernel(prod, kind, gamma, degree=2, coef0=1.0, sq_dists=None, sq_a=None, sq_b=None):
+    """由内积矩阵（及平方距离或行平方和）得到 linear / rbf / poly 核"""
+    if kind == "linear":
+        return prod
+    if kind == "poly":
+        return (gamma * prod + coef0) ** degree
+    if kind == "rbf":
+        if sq_dists is None:
+            sq_dists = np.maximum(sq_a[:, None] + sq_b[None, :] - 2 * prod, 0)
+        return np.exp(-gamma * sq_dists)
+    raise ValueError(f"不支持的核函数: {kind}")
+
+
+class KernelCache:
+    """一个训练集的基因组核缓存
+
+    内积矩阵 XXᵀ 按标记块计算一次，平方距离矩阵由它和行平方和导出；linear / poly / 任意带宽的 rbf 核
+    都从这两个矩阵得到，不再访问基因型。store_dir 不为空时两个矩阵保存为 .npy 并以内存映射方式读取。
+    """
+
+    def __init__(self, X, key, store_dir=None, block_size=4096, sq_norms=None):
+        self.X = X
+        self.key = key
+        self.store_dir = store_dir
+        self.block_size = block_size
+        self.sq_norms = row_sq_norms(X, block_size) if sq_norms is None else sq_norms
+        self._gram = None
+        self._sq_dists = None
+
+    def subset(self, idx, key):
+        """由样本子集（如交叉验证的训练折）构建核缓存，直接切取已计算的矩阵"""
+        cache = KernelCache(self.X[idx], key, None, self.block_size, self.sq_norms[idx])
+        if self._gram is not None:
+            cache._gram = np.asarray(self._gram)[np.ix_(idx, idx)]
+        if self._sq_dists is not None:
+            cache._sq_dists = np.asarray(self._sq_dists)[np.ix_(idx, idx)]
+        return cache
+
+    def _stored(self, name, compute):
+        if self.store_dir is None:
+            return compute()
+        path = os.path.join(self.store_dir, f"{self.key}_{name}.npy")
+        if not os.path.isfile(path):
+            os.makedirs(self.store_dir, exist_ok=True)
+            np.save(path, compute())
+        return np.load(path, mmap_mode="r")
+
+    @property
+    def gram(self):
+        if self._gram is None:
+            self._gram = self._stored("gram", lambda: blocked_products(self.X, self.X, self.block_size))
+        return self._gram
+
+    @property
+    def sq_dists(self):
+        if self._sq_dists is None:
+            gram = self.gram
+            self._sq_dists = self._stored(
+                "sqdist", lambda: np.maximum(self.sq_norms[:, None] + self.sq_norms[None, :] - 2 * gram, 0))
+        return self._sq_dists
+
+    def kernel(self, kind, gamma=None, degree=2, coef0=1.0):
+        gamma = 1.0 / self.X.shape[1] if gamma is None else gamma
+        if kind == "rbf":
+            return apply_kernel(None, kind, gamma, sq_dists=self.sq_dists)
+        return np.array(apply_kernel(self.gram, kind, gamma, degree, coef0))
+
+
+def kernel_cache(X, store_dir=None):
+    """按基因型内容查找或创建训练集的核缓存
+
+    X 是某个已缓存矩阵的行子集（列完全相同，如不重新筛选标记的交叉验证训练折）时，从该缓存中切取子矩阵。
+    """
+    return _KERNEL_CACHE.get(X, lambda X, key: KernelCache(X, key, store_dir),
+                             lambda parent, idx, X, key: parent.subset(idx, key))
+
+
+def cross_kernel(X_new, X_train, train_sq_norms, kind, gamma, degree=2, coef0=1.0, block_size=4096):
+    """新样本与训练集之间的核矩阵"""
+    prod = blocked_products(X_new, X_train, block_size)
+    sq_new = row_sq_norms(X_new, block_size) if kind == "rbf" else None
+    return apply_kernel(prod, kind, gamma, degree, coef0, sq_a=sq_new, sq_b=train_sq_norms)
+
+
+class KernelModel(BaseEstimator, RegressorMixin):
+    """基于预计算核的 KRR / SVR / GBLUP
+
+    训练核取自 kernel_cache，超参数搜索和交叉验证中同一训练集只计算一次内积和距离矩阵，
+    新的 gamma 只需对缓存的平方距离做一次逐元素指数运算。GBLUP 使用按平均对角元归一化的核
+    （标准化基因型的线性核即 G 矩阵），并用 REML 估计方差组分。
+    """
+
+    def __init__(self, estimator="KRR", kernel="rbf", gamma=None, degree=2, coef0=1.0, alpha=0.1, C=100.0,
+                 epsilon=0.1, standardize=False, store_dir=None):
+        self.estimator = estimator
+        self.kernel = kernel
+        self.gamma = gamma
+        self.degree = degree
+        self.coef0 = coef0
+        self.alpha = alpha
+        self.C = C
+        self.epsilon = epsilon
+        self.standardize = standardize
+        self.store_dir = store_dir
+
+    def _make_estimator(self):
+        if self.estimator == "KRR":
+            return KernelRidge(alpha=self.alpha, kernel="precomputed")
+        if self.estimator == "SVR":
+            return SVR(kernel="precomputed", C=self.C, epsilon=self.epsilon)
+        if self.estimator == "GBLUP":
+            return GBLUPModel(kernel="precomputed")
+        raise ValueError(f"不支持的核模型: {self.estimator}")
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        self.scaler_ = None
+        if self.standardize:
+            self.scaler_ = StandardScaler()
+            X = self.scaler_.fit_transform(X)
+        cache = kernel_cache(X, self.store_dir)
+        self.gamma_ = 1.0 / X.shape[1] if self.gamma is None else self.gamma
+        K = cache.kernel(self.kernel, self.gamma_, self.degree, self.coef0)
+
+        self.kernel_scale_ = 1.0
+        if self.estimator == "GBLUP":
+            self.kernel_scale_ = float(np.mean(np.diag(K)))
+            K = K / self.kernel_scale_
+        self.estimator_ = self._make_estimator().fit(K, y)
+        self.X_train_, self.train_sq_norms_ = cache.X, cache.sq_norms
+        self.h2_ = getattr(self.estimator_, "h2_", None)
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if self.scaler_ is not None:
+            X = self.scaler_.transform(X)
+        K = cross_kernel(X, self.X_train_, self.train_sq_norms_, self.kernel, self.gamma_, self.degree, self.coef0)
+        return self.estimator_.predict(K / self.kernel_scale_)
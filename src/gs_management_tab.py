@@ -1,7 +1,8 @@
 import pandas as pd
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
-    QVBoxLayout, QHBoxLayout, QPushButton, QGroupBox, QFormLayout, QLabel, QSpinBox, QMessageBox, QComboBox
+    QVBoxLayout, QHBoxLayout, QPushButton, QGroupBox, QFormLayout, QLabel, QSpinBox, QMessageBox, QComboBox,
+    QCheckBox
 )
 
 from common_tab import CommonTab, DraggableLineEdit
@@ -15,13 +16,16 @@ class GSTab(CommonTab):
         self.btn_run_gs.clicked.connect(self.run_gs)
 
     def run_gs(self):
+        if self.model_bundle_edit.text().strip():
+            self.run_prediction_only()
+            return
         if not self.pheno_file_edit.text().strip() or not self.geno_file_edit.text().strip():
             QMessageBox.critical(self, "错误", "表型数据和基因型数据文件必须选择！")
             return
         if not self.result_file_path_edit.text().strip():
             QMessageBox.critical(self, "错误", "请选择结果文件保存路径！")
             return
-        if not self.trait_combo.currentText():
+        if not self.multi_trait_check.isChecked() and not self.trait_combo.currentText():
             QMessageBox.critical(self, "错误", "请选择性状！")
             return
         gs_args = {
@@ -35,6 +39,12 @@ class GSTab(CommonTab):
             "threads": self.threads_spin.value(),
             "use_gpu": self.gpu_combo.currentText() == "启用",
             "optimization": self.optimization_combo.currentText(),
+            "impute": self.impute_combo.currentText(),
+            "multi_trait": self.multi_trait_check.isChecked(),
+            "out_of_core": self.out_of_core_check.isChecked(),
+            "cv_folds": self.cv_folds_spin.value(),
+            "cv_repeats": self.cv_repeats_spin.value(),
+            "benchmark_models": self.get_benchmark_models(),
         }
         self.log_view.append("开始 GS 分析...")
         self.worker = GSOperations(gs_args)
@@ -43,6 +53,25 @@ class GSTab(CommonTab):
         self.worker.error_signal.connect(lambda msg: QMessageBox.critical(self, "错误", msg))
         self.worker.start()
 
+    def run_prediction_only(self):
+        if not self.train_model_file_edit.text().strip():
+            QMessageBox.critical(self, "错误", "请选择预测基因型文件！")
+            return
+        if not self.result_file_path_edit.text().strip():
+            QMessageBox.critical(self, "错误", "请选择结果文件保存路径！")
+            return
+        gs_args = {
+            "model_bundle": self.model_bundle_edit.text().strip(),
+            "train_file": self.train_model_file_edit.text().strip(),
+            "result_dir": self.result_file_path_edit.text().strip(),
+        }
+        self.log_view.append("使用已保存的模型进行预测...")
+        self.worker = GSOperations(gs_args)
+        self.worker.progress_signal.connect(self.upload_message)
+        self.worker.operation_complete.connect(self.show_operation_dialog)
+        self.worker.error_signal.connect(lambda msg: QMessageBox.critical(self, "错误", msg))
+        self.worker.start()
+
     def upload_message(self, message):
         self.log_view.append(message)
 
@@ -72,6 +101,7 @@ class GSTab(CommonTab):
         self.geno_file_edit = DraggableLineEdit()
         self.core_sample_edit = DraggableLineEdit()
         self.train_model_file_edit = DraggableLineEdit()
+        self.model_bundle_edit = DraggableLineEdit()
 
         def add_file_selector(label_text, line_edit):
             file_path_layout = QHBoxLayout()
@@ -90,6 +120,7 @@ class GSTab(CommonTab):
         add_file_selector("训练基因型数据文件:", self.geno_file_edit)
         # add_file_selector("核心样本ID文件 (可选):", self.core_sample_edit)
         add_file_selector("预测基因型文件:", self.train_model_file_edit)
+        add_file_selector("已保存模型 (可选):", self.model_bundle_edit)
         file_group.setLayout(file_layout)
         return file_group
 
@@ -106,11 +137,21 @@ class GSTab(CommonTab):
         self.trait_combo.setPlaceholderText("请选择性状")
         form_layout.addRow(QLabel("选择性状:"), self.trait_combo)
 
+        # 多性状联合分析
+        self.multi_trait_check = QCheckBox("全部性状联合分析（仅 GBLUP/rrBLUP/KRR/RKHS）")
+        self.multi_trait_check.toggled.connect(lambda checked: self.trait_combo.setEnabled(not checked))
+        form_layout.addRow(QLabel("多性状模式:"), self.multi_trait_check)
+
+        # 外存模式：基因型保留在磁盘上，按标记块计算
+        self.out_of_core_check = QCheckBox("基因型不载入内存，按标记块计算（仅 GBLUP/rrBLUP，超大标记集）")
+        form_layout.addRow(QLabel("外存模式:"), self.out_of_core_check)
+
         # 模型分类
         self.model_categories = {
             "BLUP": ["GBLUP", "rrBLUP(Ridge)"],
             "机器学习": ["SVR", "RF", "CatBoost", "XGBoost", "LightGBM", "GBDT"],
-            "贝叶斯方法": ["BayesA"],
+            "核方法": ["KRR", "RKHS"],
+            "贝叶斯方法": ["BayesA", "BayesB", "BayesCπ"],
             "正则化方法": ["LASSO", "ElasticNet"]
         }
 
@@ -125,6 +166,11 @@ class GSTab(CommonTab):
         form_layout.addRow(QLabel("具体模型:"), self.model_combo)
         self.update_model_combo(self.category_combo.currentText())
 
+        # 运行模式：单模型或多模型对比
+        self.run_mode_combo = QComboBox()
+        self.run_mode_combo.addItems(["单模型", "当前类别全部模型对比", "全部模型对比"])
+        form_layout.addRow(QLabel("运行模式:"), self.run_mode_combo)
+
         # 线程数
         self.threads_spin = QSpinBox()
         self.threads_spin.setRange(1, 16)
@@ -138,9 +184,24 @@ class GSTab(CommonTab):
 
         # 优化算法
         self.optimization_combo = QComboBox()
-        self.optimization_combo.addItems(["网格搜索", "随机搜索", "贝叶斯优化"])
+        self.optimization_combo.addItems(["不优化", "网格搜索", "随机搜索", "贝叶斯优化"])
         form_layout.addRow(QLabel("优化算法:"), self.optimization_combo)
 
+        self.impute_combo = QComboBox()
+        self.impute_combo.addItems(["均值填充", "众数填充", "kNN 填充"])
+        form_layout.addRow(QLabel("缺失基因型填充:"), self.impute_combo)
+
+        # 交叉验证（折数为 0 时使用单次 6:4 划分）
+        self.cv_folds_spin = QSpinBox()
+        self.cv_folds_spin.setRange(0, 10)
+        self.cv_folds_spin.setValue(5)
+        form_layout.addRow(QLabel("交叉验证折数:"), self.cv_folds_spin)
+
+        self.cv_repeats_spin = QSpinBox()
+        self.cv_repeats_spin.setRange(1, 10)
+        self.cv_repeats_spin.setValue(1)
+        form_layout.addRow(QLabel("交叉验证重复次数:"), self.cv_repeats_spin)
+
         # 执行按钮
         self.btn_run_gs = QPushButton("执行基因型选择")
         self.btn_run_gs.setIcon(QIcon("../icons/run.svg"))
@@ -150,6 +211,14 @@ class GSTab(CommonTab):
         gs_param_group.setLayout(form_layout)
         return gs_param_group
 
+    def get_benchmark_models(self):
+        mode = self.run_mode_combo.currentText()
+        if mode == "当前类别全部模型对比":
+            return self.model_categories.get(self.category_combo.currentText(), [])
+        if mode == "全部模型对比":
+            return [m for models in self.model_categories.values() for m in models]
+        return None
+
     def update_model_combo(self, category):
         current_models = self.model_categories.get(category, [])
         self.model_combo.clear()
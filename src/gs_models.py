@@ -0,0 +1,37 @@
+from sklearn.ensemble import RandomForestRegressor
+
+from gs_bayes import BayesAlphabetModel
+from gs_blup import GBLUPModel, RRBLUPModel
+from gs_boost import EARLY_STOPPING_ROUNDS, CatBoostModel, GBDTModel, LightGBMModel, XGBoostModel
+from gs_kernels import KernelModel
+from gs_rkhs import MultiKernelModel
+from gs_sparse import SparsePathModel
+
+# 界面显示名称与模型名称的对应关系
+MODEL_ALIASES = {"rrBLUP(Ridge)": "rrBLUP"}
+
+
+def create_model(model, threads=1, use_gpu=False):
+    """按名称创建未拟合的模型实例，主线程与交叉验证等子进程共用"""
+    models = {
+        "GBLUP": GBLUPModel(back_solve=True),
+        "KRR": KernelModel("KRR", kernel="rbf", alpha=0.1),
+        "RKHS": MultiKernelModel(),
+        "BayesA": BayesAlphabetModel("BayesA", n_jobs=threads),
+        "BayesB": BayesAlphabetModel("BayesB", n_jobs=threads),
+        "BayesCπ": BayesAlphabetModel("BayesCπ", n_jobs=threads),
+        "rrBLUP": RRBLUPModel(),
+        "LASSO": SparsePathModel(l1_ratio=1.0, n_jobs=threads),
+        "SVR": KernelModel("SVR", kernel="linear", C=100),
+        "RF": RandomForestRegressor(n_estimators=500, n_jobs=threads, random_state=42),
+        "CatBoost": CatBoostModel(n_jobs=threads, use_gpu=use_gpu, early_stopping_rounds=EARLY_STOPPING_ROUNDS),
+        "XGBoost": XGBoostModel(n_jobs=threads, use_gpu=use_gpu, early_stopping_rounds=EARLY_STOPPING_ROUNDS),
+        "LightGBM": LightGBMModel(n_jobs=threads, use_gpu=use_gpu, early_stopping_rounds=EARLY_STOPPING_ROUNDS),
+        "GBDT": GBDTModel(early_stopping_rounds=EARLY_STOPPING_ROUNDS),
+        "ElasticNet": SparsePathModel(l1_ratio=0.5, n_jobs=threads)
+    }
+
+    model_instance = models.get(MODEL_ALIASES.get(model, model))
+    if model_instance is None:
+        raise ValueError(f"不支持的模型: {model}")
+    return model_instance
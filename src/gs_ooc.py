@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from gs import vcf_to_dosage_file, evaluate_predictions
+from gs_blup import GBLUPModel, RRBLUPModel
+from gs_impute import GenotypeImputer, marker_statistics
+from gs_precision import BLOCK_SIZE, as_work, blocked_products, blocked_t_dot
+from gs_screen import MarkerSelector, block_correlations, f_statistics
+from gs_threads import thread_budget, describe_threads
+
+# 外存模式支持的模型：预测值对标记线性，只需 n×n 内积矩阵即可求解
+OUT_OF_CORE_MODELS = ("GBLUP", "rrBLUP")
+
+
+class DosageStore:
+    """磁盘上的标记主序 int8 剂量矩阵（标记 × 样本，缺失为 -1），按标记块内存映射读取
+
+    同一标记的全部样本在文件中连续存放，逐块扫描时每次只读入 block_size 个标记。
+    rows 为参与分析的样本（如核心样本）在文件中的列号。
+    """
+
+    def __init__(self, path, sample_ids, markers, rows=None):
+        self.path = path
+        self.sample_ids = list(sample_ids)
+        self.markers = markers
+        self.rows = np.arange(len(self.sample_ids)) if rows is None else np.asarray(rows)
+        self.dosage = np.memmap(path, dtype=np.int8, mode="r", shape=(len(markers), len(self.sample_ids)))
+
+    @classmethod
+    def from_vcf(cls, vcf_file, save_path, sample_ids=None):
+        """逐行解码 VCF 写入剂量文件，不在内存中生成基因型矩阵"""
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+        samples, markers = vcf_to_dosage_file(vcf_file, save_path)
+        rows = None
+        if sample_ids is not None:
+            index = {sample: i for i, sample in enumerate(samples)}
+            missing = [str(sample) for sample in sample_ids if sample not in index]
+            if missing:
+                raise ValueError(f"VCF 文件中缺少样本: {', '.join(missing[:5])}")
+            rows = [index[sample] for sample in sample_ids]
+        return cls(save_path, samples, markers, rows)
+
+    @property
+    def shape(self):
+        """(样本数, 标记数)"""
+        return len(self.rows), len(self.markers)
+
+    def blocks(self, block_size=BLOCK_SIZE):
+        """逐块产出 (标记号, 样本 × 标记的 int8 块)"""
+        for start in range(0, self.shape[1], block_size):
+            block = self.dosage[start:start + block_size]
+            yield np.arange(start, start + len(block)), np.ascontiguousarray(block[:, self.rows].T)
+
+    def close(self, remove=False):
+        self.dosage = None
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def _standardized_blocks(store, imputer, support, train_idx, scale, block_size):
+    """逐块产出保留标记的 (在保留标记中的位置, 标准化后的 float32 块, 训练集均值, 尺度)
+
+    缺失填充在完整的连续标记块上进行（与第一遍扫描的分块相同），再取出保留的标记；
+    均值和尺度（scale=True 时为标准差，零方差标记为 1）只由训练集样本计算。
+    """
+    selected = np.flatnonzero(support)
+    for cols, block in store.blocks(block_size):
+        keep = support[cols]
+        if not keep.any():
+            continue
+        filled = as_work(imputer.subset(cols).transform(block))[:, keep]
+        train = filled[train_idx]
+        mean = train.mean(axis=0, dtype=np.float64)
+        std = np.ones(len(mean))
+        if scale:
+            std = train.std(axis=0, dtype=np.float64)
+            std[std == 0] = 1.0
+        Z = (filled - mean.astype(np.float32)) / std.astype(np.float32)
+        yield np.searchsorted(selected, cols[keep]), Z, mean, std
+
+
+def out_of_core_selections(store, phenotypic_data, model, threads, progress=None, impute="mean", k=40000,
+                           p_value=None, block_size=BLOCK_SIZE):
+    """外存模式的单性状基因组选择（GBLUP / rrBLUP）：基因型保留在磁盘上，按标记块扫描三遍
+
+    1. 统计各标记的填充参数，填充后与训练集表型计算 F 统计量，完成标记预筛选；
+    2. 保留的标记按训练集标准化（rrBLUP 只中心化），累加训练集内积矩阵及测试集与训练集的交叉内积；
+    3. 在 n×n 内积矩阵上求解后，按标记块反解标记效应，得到可保存为模型包并分块预测的标记效应模型。
+    内存占用为 O(n² + n × block_size)，与标记数无关。返回与 genomic_selections 相同结构的结果。
+    """
+    try:
+        if model not in OUT_OF_CORE_MODELS:
+            raise ValueError(f"外存模式仅支持 {'/'.join(OUT_OF_CORE_MODELS)}，当前模型: {model}")
+        with thread_budget(threads) as thread_report:
+            if progress is not None:
+                progress(describe_threads(thread_report))
+            n_samples, n_markers = store.shape
+            y = np.asarray(phenotypic_data, dtype=np.float64)
+            train_idx, test_idx = train_test_split(np.arange(n_samples), test_size=0.4, random_state=0)
+            y_train = y[train_idx]
+            imputer = GenotypeImputer(impute)
+            if imputer.method == "knn":
+                # kNN 的 LD 窗口不能跨越标记块
+                block_size = max(imputer.window, block_size // imputer.window * imputer.window)
+
+            # 第一遍：填充参数与标记 F 统计量
+            means, n_obs = np.zeros(n_markers), np.zeros(n_markers, dtype=np.int64)
+            counts = np.zeros((3, n_markers), dtype=np.int64)
+            corr = np.zeros(n_markers)
+            yc = y_train - y_train.mean()
+            for cols, block in store.blocks(block_size):
+                stats = marker_statistics(block)
+                means[cols], counts[:, cols], n_obs[cols] = stats
+                filled = GenotypeImputer(impute).fit_statistics(*stats, n_samples=n_samples).transform(block)
+                corr[cols] = block_correlations(filled[train_idx], yc)
+            imputer.fit_statistics(means, counts, n_obs, n_samples)
+            selector = MarkerSelector(k=k, p_value=p_value).fit_scores(*f_statistics(corr, len(train_idx)))
+            support = selector.get_support()
+            n_selected = int(support.sum())
+            if progress is not None:
+                progress(f"外存模式：标记筛选完成，保留 {n_selected}/{n_markers} 个标记")
+
+            # 第二遍：训练集内积矩阵及测试集交叉内积
+            scale = model == "GBLUP"
+            K_train = np.zeros((len(train_idx), len(train_idx)))
+            K_cross = np.zeros((len(test_idx), len(train_idx)))
+            marker_means, marker_scales = np.zeros(n_selected), np.ones(n_selected)
+            for pos, Z, mean, std in _standardized_blocks(store, imputer, support, train_idx, scale, block_size):
+                Z_train = Z[train_idx]
+                K_train += blocked_products(Z_train, Z_train)
+                K_cross += blocked_products(Z[test_idx], Z_train)
+                marker_means[pos], marker_scales[pos] = mean, std
+
+            if model == "GBLUP":
+                model_instance = GBLUPModel(kernel="precomputed").fit(K_train / n_selected, y_train)
+                test = model_instance.predict(K_cross / n_selected)
+                weights = model_instance.vg_ * model_instance.alpha_ / n_selected
+            else:
+                model_instance = RRBLUPModel().fit_gram(K_train, y_train)
+                test = np.dot(K_cross, model_instance.dual_coef_) + model_instance.y_mean_
+                weights = model_instance.dual_coef_
+            del K_train, K_cross
+            if progress is not None:
+                progress("外存模式：模型求解完成，开始反解标记效应")
+
+            # 第三遍：标记效应 = 标准化训练集基因型ᵀ · 对偶权重
+            effects = np.zeros(n_selected)
+            for pos, Z, _, _ in _standardized_blocks(store, imputer, support, train_idx, scale, block_size):
+                effects[pos] = blocked_t_dot(Z[train_idx], weights)
+            if model == "GBLUP":
+                model_instance.set_marker_effects(effects, marker_means, marker_scales)
+            else:
+                model_instance.set_marker_effects(effects, marker_means)
+
+        metrics = evaluate_predictions(y[test_idx], test)
+        metrics["gebv"] = []
+        metrics["h2"] = getattr(model_instance, "h2_", None)
+        metrics["model"] = model_instance
+        metrics["support"] = support
+        metrics["marker_means"] = marker_means
+        metrics["n_train"] = len(train_idx)
+        metrics["threads"] = thread_report
+        metrics["imputer"] = imputer
+        return metrics
+    except Exception as e:
+        raise ValueError(f"外存模式基因组选择时发生错误: {str(e)}")
@@ -1,6 +1,18 @@
+import os
+
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from gs import get_sample_id, read_vcf, get_pheno, genomic_selections, visualize_results, save_GEBV
+from gs import get_sample_id, read_vcf, get_pheno, get_pheno_matrix, genomic_selections, visualize_results, save_GEBV
+from gs_benchmark import benchmark_models, save_leaderboard
+from gs_blup import eigen_scope
+from gs_bundle import build_bundle, save_bundle, load_bundle, stream_predict_with_bundle
+from gs_cv import save_cv_folds
+from gs_impute import IMPUTE_METHODS
+from gs_models import MODEL_ALIASES
+from gs_ooc import DosageStore, out_of_core_selections
+from gs_shared import shared_scope
+from gs_threads import describe_threads
+from gs_tuning import save_tuning_result
 
 
 class GSOperations(QThread):
@@ -14,27 +26,132 @@ class GSOperations(QThread):
 
     def run(self):
         try:
-            sample_ids = get_sample_id(self.gs_args["core_sample_file"])
-            ids, geno_data = read_vcf(self.gs_args["geno_file"], sample_ids)
-            self.progress_signal.emit("训练基因型数据读取完成")
+            # 运行中创建的共享内存段（交叉验证、超参数优化、多模型对比等进程池使用）在任何步骤失败时都会被释放，
+            # 特征分解缓存只在本次运行内有效
+            with shared_scope(), eigen_scope():
+                self.run_selection()
+        except Exception as e:
+            self.error_signal.emit(f"发生错误: {str(e)}")
+
+    def run_selection(self):
+        if self.gs_args.get("model_bundle"):
+            self.run_prediction_only()
+            return
+
+        sample_ids = get_sample_id(self.gs_args["core_sample_file"])
+        if self.gs_args.get("out_of_core") and not self.gs_args.get("multi_trait"):
+            self.run_out_of_core(sample_ids)
+            return
+        ids, geno_data, markers = read_vcf(self.gs_args["geno_file"], sample_ids, return_markers=True)
+        self.progress_signal.emit("训练基因型数据读取完成")
 
+        # 单性状的预测文件在训练完成后分块流式预测，多性状共享核矩阵的预测需要一次读入
+        train_ids, train_genotypes = None, None
+        if self.gs_args.get("multi_trait"):
             train_ids, train_genotypes = read_vcf(self.gs_args["train_file"], None)
             self.progress_signal.emit("预测基因型数据读取完成")
+            pheno_data = get_pheno_matrix(self.gs_args["pheno_file"], None, sample_ids)
+        else:
+            pheno_data = get_pheno(self.gs_args["pheno_file"], self.gs_args["trait"], sample_ids)
+        self.progress_signal.emit("训练表型数据读取完成")
+
+        if self.gs_args.get("benchmark_models") and not self.gs_args.get("multi_trait"):
+            self.run_benchmark(geno_data, pheno_data)
+            return
+
+        self.progress_signal.emit(f"开始进行模型训练及预测，选择的模型：{self.gs_args['models']}")
+        metrics = genomic_selections(geno_data, pheno_data, self.gs_args["models"],
+                                     self.gs_args["threads"], self.gs_args["use_gpu"],
+                                     self.gs_args["optimization"], train_genotypes, train_ids,
+                                     cv_folds=self.gs_args.get("cv_folds", 0),
+                                     cv_repeats=self.gs_args.get("cv_repeats", 1),
+                                     progress=self.progress_signal.emit,
+                                     impute=IMPUTE_METHODS.get(self.gs_args.get("impute"), "mean"))
+        self.progress_signal.emit("基因组选择完成")
+
+        if "traits" in metrics:
+            self.report_multi_trait(metrics)
+            return
+        self.report_single_trait(metrics, markers)
 
+    def run_out_of_core(self, sample_ids):
+        """外存模式：训练基因型解码为磁盘上的剂量文件，按标记块训练，不载入完整矩阵"""
+        store = DosageStore.from_vcf(self.gs_args["geno_file"], f"{self.gs_args['result_dir']}/genotypes.int8",
+                                     sample_ids)
+        try:
+            self.progress_signal.emit(f"训练基因型数据转换完成：样本 {store.shape[0]} 个，标记 {store.shape[1]} 个")
             pheno_data = get_pheno(self.gs_args["pheno_file"], self.gs_args["trait"], sample_ids)
             self.progress_signal.emit("训练表型数据读取完成")
+            if self.gs_args.get("cv_folds", 0) > 1 or self.gs_args.get("benchmark_models"):
+                self.progress_signal.emit("外存模式不支持交叉验证和多模型对比，使用训练/测试集划分评估")
+            self.progress_signal.emit(f"开始外存模式模型训练，选择的模型：{self.gs_args['models']}")
+            metrics = out_of_core_selections(store, pheno_data, MODEL_ALIASES.get(self.gs_args["models"],
+                                                                                  self.gs_args["models"]),
+                                             self.gs_args["threads"], progress=self.progress_signal.emit,
+                                             impute=IMPUTE_METHODS.get(self.gs_args.get("impute"), "mean"))
+        finally:
+            store.close(remove=True)
+        self.progress_signal.emit("基因组选择完成")
+        self.report_single_trait(metrics, store.markers)
 
-            self.progress_signal.emit(f"开始进行模型训练及预测，选择的模型：{self.gs_args['models']}")
-            metrics = genomic_selections(geno_data, pheno_data, self.gs_args["models"],
-                                         self.gs_args["threads"], self.gs_args["use_gpu"],
-                                         self.gs_args["optimization"], train_genotypes, train_ids)
-            self.progress_signal.emit("基因组选择完成")
+    def report_single_trait(self, metrics, markers):
+        """输出单性状结果，保存模型包并流式预测预测基因型文件"""
+        result_str = f"基因组选择结果:\n保存位置{self.gs_args['result_dir']}性能指标:\nR²={metrics['R²']}\npcc = {metrics['PCC']}\nrmse = {metrics['RMSE']}"
+        if metrics["h2"] is not None:
+            result_str += f"\n遗传力 h² = {metrics['h2']}"
+        if "tuning" in metrics:
+            result_str += f"\n最优超参数: {metrics['tuning'].best_params_}"
+        if metrics.get("best_iteration") is not None:
+            result_str += f"\n早停最优迭代次数: {metrics['best_iteration']}"
+        result_str += f"\n{describe_threads(metrics['threads'])}"
+        self.progress_signal.emit(result_str)
+        visualize_results(metrics, self.gs_args["result_dir"])
+        if "folds" in metrics:
+            save_cv_folds(metrics["folds"], f"{self.gs_args['result_dir']}/cv_folds.csv")
+        if "tuning" in metrics:
+            save_tuning_result(metrics["tuning"], self.gs_args["result_dir"])
+        bundle = build_bundle(metrics, markers, self.gs_args)
+        save_bundle(bundle, f"{self.gs_args['result_dir']}/model_bundle.joblib")
+        self.predict_stream(bundle)
+        self.operation_complete.emit(f"基因组选择完成\n结果已保存到: {self.gs_args['result_dir']}")
 
-            result_str = f"基因组选择结果:\n保存位置{self.gs_args['result_dir']}性能指标:\nR²={metrics['R²']}\npcc = {metrics['PCC']}\nrmse = {metrics['RMSE']}"
-            self.progress_signal.emit(result_str)
-            self.operation_complete.emit(f"基因组选择完成\n结果已保存到: {self.gs_args['result_dir']}")
-            visualize_results(metrics, self.gs_args["result_dir"])
-            save_GEBV(metrics["gebv"], f"{self.gs_args['result_dir']}/GEBV.csv")
+    def run_prediction_only(self):
+        """加载已保存的模型包，只对预测基因型文件打分，不重新训练"""
+        bundle = load_bundle(self.gs_args["model_bundle"])
+        metadata = bundle["metadata"]
+        self.progress_signal.emit(f"模型读取完成：{metadata['model']}，性状 {metadata['trait']}，"
+                                  f"训练样本 {metadata['n_train']}，标记 {metadata['n_markers']}")
 
-        except Exception as e:
-            self.error_signal.emit(f"发生错误: {str(e)}")
+        self.predict_stream(bundle)
+        self.operation_complete.emit(f"预测完成\n结果已保存到: {self.gs_args['result_dir']}")
+
+    def predict_stream(self, bundle):
+        """按样本块流式预测预测基因型文件，GEBV 逐块追加写入 GEBV.csv"""
+        report = stream_predict_with_bundle(bundle, self.gs_args["train_file"],
+                                            f"{self.gs_args['result_dir']}/GEBV.csv",
+                                            self.gs_args.get("predict_block_size", 1000), self.progress_signal.emit)
+        self.progress_signal.emit(f"预测样本 {report['n_samples']} 个，标记对齐：共 {report['n_markers']} 个，"
+                                  f"缺失 {report['n_missing_markers']} 个，等位基因翻转 {report['n_flipped']} 个，"
+                                  f"缺失基因型 {report['n_missing_calls']} 个")
+
+    def run_benchmark(self, geno_data, pheno_data):
+        models = self.gs_args["benchmark_models"]
+        self.progress_signal.emit(f"开始多模型对比：{', '.join(models)}")
+        leaderboard = benchmark_models(geno_data, pheno_data, models, self.gs_args["threads"],
+                                       self.gs_args["use_gpu"], progress=self.progress_signal.emit,
+                                       impute=IMPUTE_METHODS.get(self.gs_args.get("impute"), "mean"))
+        self.progress_signal.emit(f"模型对比结果:\n{leaderboard.to_string(index=False)}")
+        save_leaderboard(leaderboard, f"{self.gs_args['result_dir']}/leaderboard.csv")
+        self.operation_complete.emit(f"多模型对比完成\n结果已保存到: {self.gs_args['result_dir']}")
+
+    def report_multi_trait(self, metrics):
+        result_dir = self.gs_args["result_dir"]
+        for trait, trait_metrics in metrics["traits"].items():
+            result_str = f"性状 {trait}:\nR²={trait_metrics['R²']}\npcc = {trait_metrics['PCC']}\nrmse = {trait_metrics['RMSE']}"
+            if trait_metrics["h2"] is not None:
+                result_str += f"\n遗传力 h² = {trait_metrics['h2']}"
+            self.progress_signal.emit(result_str)
+            visualize_results(trait_metrics, os.path.join(result_dir, trait))
+        self.progress_signal.emit(describe_threads(metrics["threads"]))
+        save_GEBV(metrics["gebv"], f"{result_dir}/GEBV.csv", columns=["SampleID"] + list(metrics["traits"]))
+        self.operation_complete.emit(f"多性状基因组选择完成\n结果已保存到: {result_dir}")
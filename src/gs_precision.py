@@ -0,0 +1,52 @@
+import numpy as np
+
+# 数值精度策略：由基因型派生的 n×p 矩阵（选出的标记、标准化基因型）以 float32 存储，
+# 矩阵乘法按标记块在 float32 上计算、块间用 float64 累加；n×n 的 G / 核矩阵、方差组分估计以及最终的分解和求解用 float64。
+# 整数剂量块内的乘积和不超过 2²⁴，float32 计算是精确的；标准化或填充后的小数剂量相对误差约 1e-6。
+WORK_DTYPE = np.float32
+BLOCK_SIZE = 4096
+
+
+def as_work(X):
+    """转换为工作精度（float32），已是 float32 时不复制"""
+    return np.asarray(X, dtype=WORK_DTYPE)
+
+
+def _block(X, start, block_size, dtype=WORK_DTYPE):
+    return np.asarray(X[:, start:start + block_size], dtype=dtype)
+
+
+def blocked_products(A, B, block_size=BLOCK_SIZE):
+    """按标记块累加 A·Bᵀ：块内 float32 矩阵乘法，块间 float64 累加"""
+    prod = np.zeros((A.shape[0], B.shape[0]))
+    for start in range(0, A.shape[1], block_size):
+        a = _block(A, start, block_size)
+        b = a if B is A else _block(B, start, block_size)
+        prod += np.dot(a, b.T)
+    return prod
+
+
+def row_sq_norms(X, block_size=BLOCK_SIZE):
+    norms = np.zeros(X.shape[0])
+    for start in range(0, X.shape[1], block_size):
+        block = _block(X, start, block_size)
+        norms += np.einsum("ij,ij->i", block, block)
+    return norms
+
+
+def blocked_dot(X, W, block_size=BLOCK_SIZE):
+    """X·W（W 为 p 维系数向量或 p×k 矩阵），只把当前标记块转换为 float64，不生成完整的 float64 副本"""
+    W = np.asarray(W, dtype=np.float64)
+    out = np.zeros((X.shape[0],) + W.shape[1:])
+    for start in range(0, X.shape[1], block_size):
+        out += np.dot(_block(X, start, block_size, np.float64), W[start:start + block_size])
+    return out
+
+
+def blocked_t_dot(X, V, block_size=BLOCK_SIZE):
+    """Xᵀ·V（V 为 n 维向量或 n×k 矩阵），按标记块计算"""
+    V = np.asarray(V, dtype=np.float64)
+    out = np.empty((X.shape[1],) + V.shape[1:])
+    for start in range(0, X.shape[1], block_size):
+        out[start:start + block_size] = np.dot(_block(X, start, block_size, np.float64).T, V)
+    return out
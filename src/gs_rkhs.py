@@ -0,0 +1,162 @@
+import itertools
+
+import numpy as np
+from scipy import linalg
+from sklearn.base import BaseEstimator, RegressorMixin
+
+from gs_blup import kernel_solver, trait_patterns
+from gs_kernels import kernel_cache
+from gs_precision import as_work, blocked_dot, blocked_products, row_sq_norms
+
+RKHS_COMPONENTS = ("additive", "dominance", "gaussian")
+
+
+def heterozygosity(X):
+    """显性编码：杂合子为 1，纯合子为 0，填充后的小数剂量按与 1 的距离线性取值"""
+    return 1 - np.abs(as_work(X) - 1)
+
+
+def _centered(gram, X, mean):
+    """由原始内积矩阵得到按列均值中心化后的内积 (X - m)(X - m)ᵀ"""
+    Xm = blocked_dot(X, mean)
+    return gram - Xm[:, None] - Xm[None, :] + np.dot(mean, mean)
+
+
+def rkhs_components(X, components=RKHS_COMPONENTS):
+    """由训练集基因型构建各成分核（均按平均对角元归一化），返回 (核列表, 预测时计算交叉核所需的参数)
+
+    additive 为中心化剂量的线性核（VanRaden G），dominance 为中心化杂合子指示的线性核，
+    gaussian 为带宽取平方距离中位数倒数的高斯核。三者都由 kernel_cache 缓存的内积 / 平方距离矩阵导出，
+    不同性状、超参数及行子集（交叉验证训练折）都复用同一次计算。
+    """
+    X = np.asarray(X)
+    cache = kernel_cache(X)
+    kernels, params = [], []
+    for component in components:
+        if component == "additive":
+            mean = X.mean(axis=0, dtype=np.float64)
+            K = _centered(np.asarray(cache.gram), X, mean)
+            param = {"mean": mean}
+        elif component == "dominance":
+            H = heterozygosity(X)
+            mean = H.mean(axis=0)
+            K = _centered(np.asarray(kernel_cache(H).gram), H, mean)
+            param = {"mean": mean}
+        elif component == "gaussian":
+            D = np.asarray(cache.sq_dists)
+            off_diag = D[np.triu_indices(len(D), k=1)]
+            median = np.median(off_diag) if len(off_diag) else 1.0
+            gamma = 1.0 / median if median > 0 else 1.0
+            K = np.exp(-gamma * D)
+            param = {"gamma": gamma}
+        else:
+            raise ValueError(f"不支持的核成分: {component}")
+        param["scale"] = float(np.mean(np.diag(K))) or 1.0
+        kernels.append(K / param["scale"])
+        params.append(param)
+    return kernels, params, cache.key
+
+
+def weight_grid(n_components, steps):
+    """单纯形上步长为 1/steps 的核权重网格"""
+    grid = [np.array(c) / steps for c in itertools.product(range(steps + 1), repeat=n_components)
+            if sum(c) == steps]
+    return grid
+
+
+def fit_rkhs_traits(X, Y, models):
+    """在同一训练集上拟合多个性状的多核 RKHS，models[j] 对应 Y 的第 j 列（NaN 为缺失）
+
+    每个网格点的加权核只做一次特征分解，所有性状共用：完整性状直接在其特征基下做 REML，
+    有缺失的性状在同一特征基下通过分块求逆求解（见 gs_blup.kernel_solver）。
+    分解只存在于当前网格点的循环中，各性状只保留当前最优网格点的对偶系数。
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y, dtype=np.float64)
+    first = models[0]
+    kernels, component_params, _ = rkhs_components(X, first.components)
+    patterns = trait_patterns(Y)
+    fitted = [j for _, cols in patterns for j in cols]
+    if len(fitted) < Y.shape[1]:
+        raise ValueError("性状的有效表型少于 2 个，无法拟合 RKHS 模型")
+
+    best = [None] * Y.shape[1]
+    for weights in weight_grid(len(kernels), first.weight_steps):
+        K = sum(w * K_c for w, K_c in zip(weights, kernels) if w > 0)
+        eigvals, eigvecs = linalg.eigh(K, check_finite=False)
+        eigvals = np.clip(eigvals, 0, None)
+        for idx, cols in patterns:
+            solver = kernel_solver(eigvals, eigvecs, K, idx, None, len(cols))
+            for j in cols:
+                y = Y[idx, j]
+                delta, vg, value = solver.reml(y, first.lambda_param)
+                if best[j] is None or value < best[j][0]:
+                    alpha = np.zeros(len(Y))
+                    alpha[idx] = solver.solve((y - y.mean())[:, None], first.lambda_param + delta)[:, 0] / vg
+                    best[j] = (value, weights, delta, vg, alpha)
+
+    for j, model in enumerate(models):
+        _, model.weights_, delta, model.vg_, model.alpha_ = best[j]
+        model.y_mean_ = Y[~np.isnan(Y[:, j]), j].mean()
+        model.ve_ = delta * model.vg_
+        model.h2_ = 1 / (1 + delta)
+        # 各成分解释的遗传方差
+        model.component_vg_ = dict(zip(model.components, model.vg_ * model.weights_))
+        model.component_params_ = component_params
+        model.X_train_ = X
+    return models
+
+
+class MultiKernelModel(BaseEstimator, RegressorMixin):
+    """多核 RKHS 回归：K = Σ wₖKₖ（加性、显性、高斯成分）
+
+    核权重在单纯形网格上选择：每个网格点的加权核做一次特征分解，在其特征基下的 REML 只需 O(n²) 的投影和
+    O(n) 的似然计算，取似然最大的权重及 δ = Ve/Vg。成分核按训练集缓存；加权核的分解不跨拟合保留，
+    多性状通过 fit_rkhs_traits 在一次拟合中共用各网格点的分解。
+    """
+
+    def __init__(self, components=RKHS_COMPONENTS, weight_steps=4, lambda_param=1e-6):
+        self.components = components
+        self.weight_steps = weight_steps
+        self.lambda_param = lambda_param
+
+    def fit(self, X, y):
+        fit_rkhs_traits(X, np.asarray(y, dtype=np.float64)[:, None], [self])
+        return self
+
+    def cross_kernels(self, X, needed=None):
+        """新样本与训练集之间的各成分核（按训练集归一化），needed 为假的成分不计算（为 None）
+
+        同一次 fit_rkhs_traits 拟合的各性状模型训练集和成分参数相同，可以共用。
+        """
+        X = np.asarray(X)
+        needed = [True] * len(self.components) if needed is None else needed
+        cross, prod = [], None
+        for component, param, need in zip(self.components, self.component_params_, needed):
+            if not need:
+                cross.append(None)
+                continue
+            if component == "dominance":
+                H_new, H = heterozygosity(X), heterozygosity(self.X_train_)
+                mean = param["mean"]
+                K_c = (blocked_products(H_new, H) - blocked_dot(H_new, mean)[:, None] - blocked_dot(H, mean)[None, :]
+                       + np.dot(mean, mean))
+            else:
+                if prod is None:
+                    prod = blocked_products(X, self.X_train_)
+                if component == "additive":
+                    mean = param["mean"]
+                    K_c = (prod - blocked_dot(X, mean)[:, None] - blocked_dot(self.X_train_, mean)[None, :]
+                           + np.dot(mean, mean))
+                else:
+                    sq_dists = np.maximum(row_sq_norms(X)[:, None] + row_sq_norms(self.X_train_)[None, :] - 2 * prod, 0)
+                    K_c = np.exp(-param["gamma"] * sq_dists)
+            cross.append(K_c / param["scale"])
+        return cross
+
+    def predict_kernels(self, cross):
+        K = sum(w * K_c for w, K_c in zip(self.weights_, cross) if w > 0)
+        return self.vg_ * np.dot(K, self.alpha_) + self.y_mean_
+
+    def predict(self, X):
+        return self.predict_kernels(self.cross_kernels(X, self.weights_ > 0))
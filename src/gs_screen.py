@@ -0,0 +1,106 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy import stats
+from sklearn.base import BaseEstimator
+from sklearn.feature_selection import SelectorMixin
+
+# (基因型, 表型) 摘要 -> (F 统计量, p 值)；同一训练集和性状切换模型时跳过筛选
+_SCORE_CACHE = OrderedDict()
+_SCORE_CACHE_SIZE = 32
+
+
+def _digest(X, y):
+    h = hashlib.sha1(str((X.shape, X.dtype.str)).encode())
+    h.update(np.ascontiguousarray(X).view(np.uint8))
+    h.update(np.ascontiguousarray(y, dtype=np.float64).view(np.uint8))
+    return h.hexdigest()
+
+
+def block_correlations(block, yc):
+    """一个标记块（样本 × 标记）与中心化表型的相关系数，零方差标记为 0"""
+    block = np.asarray(block, dtype=np.float64)
+    y_ss = np.dot(yc, yc)
+    ss = np.einsum("ij,ij->j", block, block) - block.sum(axis=0) ** 2 / block.shape[0]
+    cov = np.dot(yc, block)
+    corr = np.zeros(block.shape[1])
+    valid = (ss > 1e-12) & (y_ss > 0)
+    corr[valid] = cov[valid] / np.sqrt(ss[valid] * y_ss)
+    return corr
+
+
+def f_statistics(corr, n_samples):
+    """相关系数 -> 回归 F 统计量及 p 值"""
+    dof = n_samples - 2
+    r2 = np.minimum(corr ** 2, 1.0)
+    with np.errstate(divide="ignore"):
+        f_scores = np.where(r2 < 1, r2 / (1 - r2) * dof, np.finfo(np.float64).max)
+    return f_scores, stats.f.sf(f_scores, 1, dof)
+
+
+def marker_scores(X, y, block_size=2048):
+    """逐标记的回归 F 统计量及 p 值（与 f_regression 一致）
+
+    按标记块把 int8/float32 基因型转换为 float64 计算与中心化表型的相关系数，不生成完整的 float64 矩阵。
+    结果按 (基因型, 表型) 的摘要缓存，训练集划分不同时摘要不同。
+    """
+    X = np.asarray(X)
+    y = np.asarray(y, dtype=np.float64)
+    key = _digest(X, y)
+    if key in _SCORE_CACHE:
+        _SCORE_CACHE.move_to_end(key)
+        return _SCORE_CACHE[key]
+
+    n_samples, n_markers = X.shape
+    yc = y - y.mean()
+    corr = np.zeros(n_markers)
+    for start in range(0, n_markers, block_size):
+        block = X[:, start:start + block_size]
+        corr[start:start + block.shape[1]] = block_correlations(block, yc)
+    f_scores, p_values = f_statistics(corr, n_samples)
+
+    _SCORE_CACHE[key] = (f_scores, p_values)
+    while len(_SCORE_CACHE) > _SCORE_CACHE_SIZE:
+        _SCORE_CACHE.popitem(last=False)
+    return f_scores, p_values
+
+
+class MarkerSelector(SelectorMixin, BaseEstimator):
+    """标记预筛选，代替 SelectKBest(f_regression)
+
+    k 为整数时保留 F 统计量最大的 k 个标记（标记不足 k 个时全部保留），为 (0, 1] 的小数时按比例保留；
+    给定 p_value 时改为保留 p 值小于该阈值的标记（至少保留一个）。
+    """
+
+    def __init__(self, k=40000, p_value=None, block_size=2048):
+        self.k = k
+        self.p_value = p_value
+        self.block_size = block_size
+
+    def fit(self, X, y):
+        return self.fit_scores(*marker_scores(X, y, self.block_size))
+
+    def fit_scores(self, scores, pvalues):
+        """直接使用已计算的 F 统计量和 p 值（如按标记块流式计算的结果）"""
+        self.scores_, self.pvalues_ = scores, pvalues
+        self.n_features_in_ = len(self.scores_)
+        return self
+
+    def _get_support_mask(self):
+        n_markers = len(self.scores_)
+        mask = np.zeros(n_markers, dtype=bool)
+        if self.p_value is not None:
+            mask = self.pvalues_ < self.p_value
+            if not mask.any():
+                mask[np.argmax(self.scores_)] = True
+            return mask
+        if isinstance(self.k, float) and 0 < self.k <= 1:
+            n_keep = max(1, int(round(self.k * n_markers)))
+        elif self.k == "all":
+            n_keep = n_markers
+        else:
+            n_keep = min(int(self.k), n_markers)
+        # 与 SelectKBest 相同的稳定排序，保证结果一致
+        mask[np.argsort(self.scores_, kind="mergesort")[n_markers - n_keep:]] = True
+        return mask
@@ -0,0 +1,273 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from gs import parse_vcf_lines, parse_json_from_file
+from gs_bundle import load_bundle, match_markers, align_genotypes
+
+
+class WarmModel:
+    """常驻内存的模型包
+
+    缓存各标记表（按标记 ID/REF/ALT 的摘要区分）与模型包标记的对应关系，同一芯片的后续请求无需重新匹配；
+    并发请求由后台线程合并成一批，在 max_wait 秒内凑满 max_batch_rows 行或超时后统一调用一次 predict。
+    """
+
+    def __init__(self, bundle, max_batch_rows=4096, max_wait=0.01, max_panels=16):
+        self.bundle = bundle
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.max_panels = max_panels
+        self._panels = OrderedDict()
+        self._panel_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._batch_loop, daemon=True)
+        self._thread.start()
+
+    def match(self, markers):
+        key = hashlib.sha1(pd.util.hash_pandas_object(markers[["ID", "REF", "ALT"]].astype(str),
+                                                      index=False).to_numpy().tobytes()).hexdigest()
+        with self._panel_lock:
+            if key in self._panels:
+                self._panels.move_to_end(key)
+                return self._panels[key]
+        matched = match_markers(self.bundle, markers)
+        with self._panel_lock:
+            self._panels[key] = matched
+            while len(self._panels) > self.max_panels:
+                self._panels.popitem(last=False)
+        return matched
+
+    def predict(self, genotypes, markers):
+        X, report = align_genotypes(self.bundle, genotypes, markers, self.match(markers))
+        item = {"X": X, "done": threading.Event()}
+        self._queue.put(item)
+        item["done"].wait()
+        if "error" in item:
+            raise ValueError(f"预测时发生错误: {item['error']}")
+        return item["result"], report
+
+    def close(self):
+        self._queue.put(None)
+
+    def _batch_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            items = [first]
+            rows = len(first["X"])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while rows < self.max_batch_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+                rows += len(item["X"])
+            try:
+                pred = np.asarray(self.bundle["model"].predict(np.vstack([item["X"] for item in items])))
+                bounds = np.cumsum([len(item["X"]) for item in items])[:-1]
+                for item, part in zip(items, np.split(pred, bounds)):
+                    item["result"] = part
+            except Exception as e:
+                for item in items:
+                    item["error"] = str(e)
+            for item in items:
+                item["done"].set()
+            if stop:
+                return
+
+
+def parse_request(payload):
+    """解析预测请求，返回 (样本 ID, 基因型矩阵, 标记表)
+
+    请求体为 JSON：{"vcf": VCF 文本块（需包含 #CHROM 表头行）}，
+    或打包数组 {"genotypes": base64 编码的 int8 矩阵, "shape": [样本数, 标记数], "marker_ids": [...],
+    "ref": [...], "alt": [...], "sample_ids": [...]}，ref/alt 省略时视为与训练时编码一致。
+    """
+    if "vcf" in payload:
+        sample_ids, geno_data, markers = parse_vcf_lines(payload["vcf"].splitlines(keepends=True),
+                                                         return_markers=True)
+        return sample_ids, np.asarray(geno_data, dtype=np.int8), markers
+
+    shape = tuple(payload["shape"])
+    genotypes = np.frombuffer(base64.b64decode(payload["genotypes"]), dtype=np.int8)
+    if genotypes.size != shape[0] * shape[1]:
+        raise ValueError(f"基因型数组大小与 shape 不一致: {genotypes.size} != {shape[0]} × {shape[1]}")
+    genotypes = genotypes.reshape(shape)
+    marker_ids = payload["marker_ids"]
+    if len(marker_ids) != shape[1]:
+        raise ValueError(f"标记数与基因型列数不一致: {len(marker_ids)} != {shape[1]}")
+    markers = pd.DataFrame({"ID": marker_ids, "REF": payload.get("ref", [None] * shape[1]),
+                            "ALT": payload.get("alt", [None] * shape[1])})
+    sample_ids = payload.get("sample_ids", [str(i) for i in range(shape[0])])
+    return sample_ids, genotypes, markers
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """GET /models 列出已加载的模型；POST /predict/<模型名> 返回各样本的 GEBV"""
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/models":
+            self._send(200, {name: warm.bundle["metadata"] for name, warm in self.server.models.items()})
+        else:
+            self._send(404, {"error": f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        # 任何回复之前先读完请求体，否则客户端仍在发送时连接被关闭，收到的是 Broken pipe 而不是错误信息
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        except ValueError:
+            self.close_connection = True
+            self._send(400, {"error": f"无效的 Content-Length: {self.headers.get('Content-Length')}"})
+            return
+        name = self.path[len("/predict/"):] if self.path.startswith("/predict/") else None
+        if name not in self.server.models:
+            self._send(404, {"error": f"未加载的模型: {name}"})
+            return
+        try:
+            payload = json.loads(body)
+            sample_ids, genotypes, markers = parse_request(payload)
+            gebv, report = self.server.models[name].predict(genotypes, markers)
+        except Exception as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(200, {"sample_ids": list(sample_ids), "gebv": gebv.tolist(), "alignment": report})
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix 套接字没有客户端地址
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _PredictionServerMixin:
+    def setup_models(self, models, verbose=False):
+        self.models = models
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        for warm in self.models.values():
+            warm.close()
+
+
+class PredictionServer(_PredictionServerMixin, ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class UnixPredictionServer(_PredictionServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def load_models(bundle_files, max_batch_rows=4096, max_wait=0.01):
+    """读取 {模型名: 模型包路径}，返回常驻内存的模型"""
+    return {name: WarmModel(load_bundle(path), max_batch_rows, max_wait) for name, path in bundle_files.items()}
+
+
+def curated_bundle_files(config_file):
+    """列出 curated_models.json 中全部预构建模型包，模型名为 物种_群体_性状_模型"""
+    bundle_files = {}
+    for specie in parse_json_from_file(config_file)["curated_models"]:
+        for population in specie["populations"]:
+            for trait, models in population.get("models", {}).items():
+                for model, path in models.items():
+                    if os.path.isfile(path):
+                        bundle_files[f"{specie['specie']}_{population['population']}_{trait}_{model}"] = path
+    return bundle_files
+
+
+def create_server(bundle_files, host="127.0.0.1", port=8765, unix_socket=None, max_batch_rows=4096,
+                  max_wait=0.01, verbose=False):
+    models = load_models(bundle_files, max_batch_rows, max_wait)
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixPredictionServer(unix_socket, PredictionHandler)
+    else:
+        server = PredictionServer((host, port), PredictionHandler)
+    server.setup_models(models, verbose)
+    return server
+
+
+def predict_remote(url, model, vcf_text=None, genotypes=None, marker_ids=None, ref=None, alt=None,
+                   sample_ids=None, timeout=600):
+    """向预测服务发送一批基因型（VCF 文本块或 0/1/2 剂量矩阵），返回响应字典"""
+    if vcf_text is not None:
+        payload = {"vcf": vcf_text}
+    else:
+        genotypes = np.ascontiguousarray(genotypes, dtype=np.int8)
+        payload = {"genotypes": base64.b64encode(genotypes.tobytes()).decode("ascii"),
+                   "shape": list(genotypes.shape), "marker_ids": list(marker_ids)}
+        if ref is not None and alt is not None:
+            payload["ref"], payload["alt"] = list(ref), list(alt)
+        if sample_ids is not None:
+            payload["sample_ids"] = list(sample_ids)
+    request = urllib.request.Request(f"{url.rstrip('/')}/predict/{model}", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="常驻内存的基因组选择预测服务")
+    parser.add_argument("--bundle", action="append", default=[], metavar="名称=路径",
+                        help="加载的模型包，可重复指定")
+    parser.add_argument("--curated-config", help="加载 curated_models.json 中的全部预构建模型包")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="监听 Unix 套接字而不是 TCP 端口")
+    parser.add_argument("--max-batch-rows", type=int, default=4096)
+    parser.add_argument("--max-wait", type=float, default=0.01, help="合并并发请求的最长等待时间（秒）")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    bundle_files = curated_bundle_files(args.curated_config) if args.curated_config else {}
+    for item in args.bundle:
+        name, _, path = item.partition("=")
+        if not path:
+            name, path = os.path.splitext(os.path.basename(item))[0], item
+        bundle_files[name] = path
+    if not bundle_files:
+        parser.error("至少需要一个模型包")
+
+    server = create_server(bundle_files, args.host, args.port, args.unix_socket, args.max_batch_rows, args.max_wait,
+                           args.verbose)
+    print(f"已加载模型: {', '.join(server.models)}")
+    print(f"预测服务监听: {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,136 @@
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 本进程创建的共享内存段（名称 → SharedArray），以及打开的其他进程创建的段（名称 → (SharedMemory, 只读视图)）
+_OWNED = {}
+_ATTACHED = {}
+_local = threading.local()
+
+
+class SharedArray:
+    """共享内存中的只读数组段
+
+    创建时复制一次，desc 传给子进程后由 attach 零拷贝打开；release() 关闭并删除段，可重复调用。
+    创建时处于 shared_scope 中的段在作用域退出时自动释放，进程退出时仍未释放的段也会被删除。
+    """
+
+    def __init__(self, arr):
+        arr = np.ascontiguousarray(arr)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        try:
+            self.array = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self._shm.buf)
+            self.array[:] = arr
+        except BaseException:
+            # 复制失败（如内存不足）时段不能遗留在系统中
+            self._shm.close()
+            self._shm.unlink()
+            raise
+        self.array.flags.writeable = False
+        self.desc = {"name": self._shm.name, "shape": arr.shape, "dtype": arr.dtype.str}
+        self._pid = os.getpid()
+        _OWNED[self._shm.name] = self
+        for scope in getattr(_local, "scopes", []):
+            scope.append(self)
+
+    def release(self):
+        if self._shm is None:
+            return
+        _OWNED.pop(self._shm.name, None)
+        self.array = None
+        self._shm.close()
+        # fork 出的子进程继承了登记表，只有创建段的进程负责删除
+        if os.getpid() == self._pid:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def attach(desc):
+    """按描述信息打开共享数组，返回只读视图（零拷贝）
+
+    同一进程内重复打开同一段时复用已有映射（进程池的工作进程会执行多个任务）；
+    映射保留到进程退出，调用方不需要关闭。段由本进程创建时直接返回创建方的视图。
+    """
+    name = desc["name"]
+    if name in _OWNED:
+        return _OWNED[name].array
+    if name not in _ATTACHED:
+        shm = shared_memory.SharedMemory(name=name)
+        view = np.ndarray(desc["shape"], dtype=desc["dtype"], buffer=shm.buf)
+        view.flags.writeable = False
+        _ATTACHED[name] = (shm, view)
+    return _ATTACHED[name][1]
+
+
+def release_all():
+    """释放本进程创建的全部共享内存段"""
+    for segment in list(_OWNED.values()):
+        segment.release()
+
+
+atexit.register(release_all)
+
+
+@contextmanager
+def shared_scope():
+    """作用域内（当前线程）创建的共享内存段在退出时一律释放，包括中途抛出异常的情况"""
+    scopes = _local.__dict__.setdefault("scopes", [])
+    segments = []
+    scopes.append(segments)
+    try:
+        yield segments
+    finally:
+        scopes.remove(segments)
+        for segment in segments:
+            segment.release()
+
+
+def compact_genotypes(genotypes):
+    """基因型矩阵的紧凑表示：全为整数剂量时用 int8，含填充后的小数剂量时用 float32"""
+    X = np.asarray(genotypes)
+    if X.dtype == np.int8:
+        return X
+    if np.issubdtype(X.dtype, np.integer) or np.array_equal(X, np.round(X)):
+        return X.astype(np.int8)
+    return X.astype(np.float32)
+
+
+class SharedGenotypes(SharedArray):
+    """发布到共享内存的基因型矩阵（紧凑的 int8 / float32）
+
+    只复制一次，desc 传给工作进程后由 attach_genotypes 得到零拷贝的只读视图，替代把矩阵序列化到每个任务。
+    """
+
+    def __init__(self, genotypes):
+        super().__init__(compact_genotypes(genotypes))
+
+    @property
+    def X(self):
+        return self.array
+
+
+def attach_genotypes(desc):
+    return attach(desc)
+
+
+@contextmanager
+def publish_genotypes(genotypes):
+    """已发布的 SharedGenotypes 直接使用（由调用方管理生命周期），否则临时发布并在退出时释放"""
+    if isinstance(genotypes, SharedGenotypes):
+        yield genotypes
+        return
+    with SharedGenotypes(genotypes) as shared:
+        yield shared
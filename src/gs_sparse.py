@@ -0,0 +1,127 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.linear_model import enet_path
+from sklearn.model_selection import KFold
+
+from gs_shared import SharedArray, attach
+from gs_threads import limit_threads
+
+
+def _standardize(X):
+    """列标准化(float32)，零方差标记的尺度记为 1"""
+    mean = X.mean(axis=0, dtype=np.float64).astype(np.float32)
+    scale = X.std(axis=0, dtype=np.float64).astype(np.float32)
+    scale[scale == 0] = 1
+    return np.asfortranarray((X - mean) / scale), mean, scale
+
+
+def alpha_grid(X, y, l1_ratio, n_alphas=50, eps=1e-3):
+    """从 α_max（所有系数恰好为 0）到 eps·α_max 的对数网格；X 已标准化，y 已中心化"""
+    alpha_max = np.max(np.abs(np.dot(X.T, y))) / (X.shape[0] * l1_ratio)
+    return np.geomspace(alpha_max, alpha_max * eps, n_alphas)
+
+
+def sparse_path(X, y, alphas, l1_ratio=1.0, tol=1e-4, max_iter=1000):
+    """带热启动和序贯强规则筛选的 LASSO/ElasticNet 正则化路径
+
+    目标函数与 sklearn ElasticNet 一致。每个 α 只在强规则保留的标记（及曾经非零的标记）上做坐标下降，
+    再用 KKT 条件检查被筛掉的标记，违反者加入后重新求解。返回系数矩阵（p × len(alphas)）。
+    """
+    n_samples, n_features = X.shape
+    coef = np.zeros(n_features, dtype=X.dtype)
+    coefs = np.zeros((n_features, len(alphas)), dtype=X.dtype)
+    ever_active = np.zeros(n_features, dtype=bool)
+    resid = y.copy()
+    prev_alpha = alphas[0]
+
+    for i, alpha in enumerate(alphas):
+        # 序贯强规则：|x_jᵀr(α_{k-1})| / n < l1_ratio·(2α_k − α_{k-1}) 的标记大概率为 0
+        grad = np.abs(np.dot(X.T, resid)) / n_samples
+        strong = ever_active | (grad >= l1_ratio * (2 * alpha - prev_alpha))
+        while True:
+            idx = np.flatnonzero(strong)
+            coef[:] = 0
+            if len(idx) > 0:
+                _, sub_coefs, _ = enet_path(np.asfortranarray(X[:, idx]), y, l1_ratio=l1_ratio, alphas=[alpha],
+                                            coef_init=coefs[idx, i - 1] if i > 0 else None,
+                                            tol=tol, max_iter=max_iter)
+                coef[idx] = sub_coefs[:, 0]
+            resid = y - np.dot(X[:, idx], coef[idx])
+            violations = ~strong & (np.abs(np.dot(X.T, resid)) / n_samples > alpha * l1_ratio)
+            if not violations.any():
+                break
+            strong |= violations
+        ever_active |= coef != 0
+        coefs[:, i] = coef
+        prev_alpha = alpha
+    return coefs
+
+
+def _fold_path(task):
+    X = attach(task["geno"])
+    x_train, mean, scale = _standardize(X[task["train_idx"]])
+    x_val = (X[task["val_idx"]] - mean) / scale
+    del X
+    y_train = task["y"][task["train_idx"]]
+    y_mean = y_train.mean()
+    coefs = sparse_path(x_train, (y_train - y_mean).astype(np.float32), task["alphas"],
+                        task["l1_ratio"], task["tol"], task["max_iter"])
+    pred = np.dot(x_val, coefs) + y_mean
+    return np.mean((task["y"][task["val_idx"], None] - pred) ** 2, axis=0)
+
+
+class SparsePathModel(BaseEstimator, RegressorMixin):
+    """LASSO(l1_ratio=1) / ElasticNet 正则化路径模型
+
+    在 float32 标准化基因型上计算整条热启动路径，cv 折交叉验证（各折并行）选择 α，
+    最终只在全部数据上把路径算到所选 α 为止。
+    """
+
+    def __init__(self, l1_ratio=1.0, n_alphas=50, eps=1e-3, cv=5, tol=1e-4, max_iter=1000, n_jobs=1,
+                 random_state=0):
+        self.l1_ratio = l1_ratio
+        self.n_alphas = n_alphas
+        self.eps = eps
+        self.cv = cv
+        self.tol = tol
+        self.max_iter = max_iter
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float64)
+        X_std, self.mean_, self.scale_ = _standardize(X)
+        self.y_mean_ = y.mean()
+        yc = (y - self.y_mean_).astype(np.float32)
+        self.alphas_ = alpha_grid(X_std, yc, self.l1_ratio, self.n_alphas, self.eps)
+
+        splits = KFold(n_splits=self.cv, shuffle=True, random_state=self.random_state).split(X)
+        with SharedArray(X) as shared:
+            tasks = [{"geno": shared.desc, "y": y, "train_idx": train_idx, "val_idx": val_idx, "alphas": self.alphas_,
+                      "l1_ratio": self.l1_ratio, "tol": self.tol, "max_iter": self.max_iter}
+                     for train_idx, val_idx in splits]
+            n_workers = max(1, min(self.n_jobs, len(tasks), os.cpu_count() or 1))
+            if n_workers == 1:
+                mse = [_fold_path(task) for task in tasks]
+            else:
+                # 各折在单线程进程中计算
+                with ProcessPoolExecutor(max_workers=n_workers, initializer=limit_threads,
+                                         initargs=(1,)) as executor:
+                    mse = list(executor.map(_fold_path, tasks))
+
+        self.mse_path_ = np.array(mse).T
+        best = int(np.argmin(self.mse_path_.mean(axis=1)))
+        self.alpha_ = self.alphas_[best]
+
+        coefs = sparse_path(X_std, yc, self.alphas_[:best + 1], self.l1_ratio, self.tol, self.max_iter)
+        # 折算回原始剂量尺度
+        self.coef_ = coefs[:, -1].astype(np.float64) / self.scale_
+        self.intercept_ = self.y_mean_ - np.dot(self.mean_, self.coef_)
+        return self
+
+    def predict(self, X):
+        return np.dot(np.asarray(X, dtype=np.float64), self.coef_) + self.intercept_
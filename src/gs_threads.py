@@ -0,0 +1,77 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from threadpoolctl import threadpool_info, threadpool_limits
+
+
+def pool_threads():
+    """当前进程中已加载的 BLAS / OpenMP 线程池的线程数，未加载时为 None"""
+    threads = {"blas": None, "openmp": None}
+    for pool in threadpool_info():
+        api = pool.get("user_api")
+        if api in threads:
+            threads[api] = max(threads[api] or 0, pool["num_threads"])
+    return threads
+
+
+def limit_threads(threads):
+    """限制当前进程 BLAS / OpenMP 线程池的线程数，进程池的工作进程在执行任务时使用"""
+    return threadpool_limits(limits=max(1, int(threads)))
+
+
+class ThreadBudget:
+    """进程内的线程预算
+
+    总预算默认为 CPU 核数（可由环境变量 GS_THREAD_BUDGET 指定）。每个任务开始时分到
+    min(请求线程数, 总预算 / 并发任务数)，模型的 n_jobs / thread_count 使用分到的线程数；
+    BLAS 和 OpenMP 线程池是进程级的，任务开始或结束时按当前并发任务数重新设置上限。
+    """
+
+    def __init__(self, total=None):
+        self.total = total or int(os.environ.get("GS_THREAD_BUDGET", 0)) or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._limiter = None
+
+    def _apply(self):
+        # 调用方持有锁
+        if self._limiter is not None:
+            self._limiter.restore_original_limits()
+            self._limiter = None
+        if self._jobs:
+            limit = min(max(self._jobs.values()), max(1, self.total // len(self._jobs)))
+            self._limiter = threadpool_limits(limits=limit)
+
+    @contextmanager
+    def job(self, threads):
+        requested = max(1, int(threads or 1))
+        key = object()
+        with self._lock:
+            granted = min(requested, max(1, self.total // (len(self._jobs) + 1)))
+            self._jobs[key] = granted
+            self._apply()
+            report = dict(requested=requested, granted=granted, concurrent_jobs=len(self._jobs), **pool_threads())
+        try:
+            yield report
+        finally:
+            with self._lock:
+                del self._jobs[key]
+                self._apply()
+
+
+THREAD_BUDGET = ThreadBudget()
+
+
+def thread_budget(threads):
+    """在全局线程预算中登记一个任务，返回的报告中 granted 为该任务实际可用的线程数"""
+    return THREAD_BUDGET.job(threads)
+
+
+def describe_threads(report):
+    text = f"线程：请求 {report['requested']}，实际 {report['granted']}（并发任务 {report['concurrent_jobs']}）"
+    if report["blas"] is not None:
+        text += f"，BLAS {report['blas']}"
+    if report["openmp"] is not None:
+        text += f"，OpenMP {report['openmp']}"
+    return text
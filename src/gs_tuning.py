@@ -0,0 +1,236 @@
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern, WhiteKernel
+from sklearn.model_selection import KFold
+
+from gs_boost import BOOST_MODELS, boost_dataset
+from gs_models import MODEL_ALIASES, create_model
+from gs_precision import as_work
+from gs_shared import SharedArray, attach
+from gs_threads import limit_threads
+
+# 界面优化算法名称与搜索方法的对应关系
+OPTIMIZATION_METHODS = {"网格搜索": "grid", "随机搜索": "random", "贝叶斯优化": "bayes"}
+
+# 各模型的搜索空间：("log", 下限, 上限) 对数均匀，("float", 下限, 上限) 均匀，("int", 下限, 上限) 整数，("choice", [候选值])
+# GBLUP 和多核 RKHS 通过 REML 估计方差组分（RKHS 同时选择核权重），rrBLUP 通过闭式留一误差、
+# LASSO 通过交叉验证在整条正则化路径上选择 alpha，贝叶斯字母表模型在 Gibbs 抽样中估计方差组分，
+# 这些模型不需要搜索；ElasticNet 只需搜索 l1_ratio
+SEARCH_SPACES = {
+    "KRR": {"alpha": ("log", 1e-3, 10.0), "gamma": ("log", 1e-6, 1e-3)},
+    "ElasticNet": {"l1_ratio": ("float", 0.1, 0.9)},
+    "SVR": {"C": ("log", 1e-4, 1e2)},
+    "RF": {"max_features": ("choice", ["sqrt", 0.1, 0.3]), "min_samples_leaf": ("int", 1, 10)},
+    "CatBoost": {"learning_rate": ("log", 0.01, 0.3), "depth": ("int", 2, 8), "l2_leaf_reg": ("log", 1.0, 30.0)},
+    "XGBoost": {"learning_rate": ("log", 0.01, 0.3), "max_depth": ("int", 2, 8),
+                "subsample": ("float", 0.5, 1.0), "colsample_bytree": ("float", 0.1, 1.0)},
+    "LightGBM": {"learning_rate": ("log", 0.01, 0.3), "num_leaves": ("int", 4, 64),
+                 "min_child_samples": ("int", 5, 50), "colsample_bytree": ("float", 0.1, 1.0)},
+    "GBDT": {"learning_rate": ("log", 0.01, 0.3), "max_depth": ("int", 2, 8), "subsample": ("float", 0.5, 1.0)},
+}
+
+
+def _grid_values(spec, points):
+    kind = spec[0]
+    if kind == "choice":
+        return list(spec[1])
+    if kind == "log":
+        return [float(v) for v in np.geomspace(spec[1], spec[2], points)]
+    if kind == "int":
+        return sorted({int(round(v)) for v in np.linspace(spec[1], spec[2], points)})
+    return [float(v) for v in np.linspace(spec[1], spec[2], points)]
+
+
+def _decode(space, u):
+    """单位超立方体中的点 -> 参数字典"""
+    params = {}
+    for (name, spec), value in zip(space.items(), u):
+        kind = spec[0]
+        if kind == "choice":
+            params[name] = spec[1][min(int(value * len(spec[1])), len(spec[1]) - 1)]
+        elif kind == "log":
+            params[name] = float(math.exp(math.log(spec[1]) + value * (math.log(spec[2]) - math.log(spec[1]))))
+        elif kind == "int":
+            params[name] = int(round(spec[1] + value * (spec[2] - spec[1])))
+        else:
+            params[name] = float(spec[1] + value * (spec[2] - spec[1]))
+    return params
+
+
+def _encode(space, params):
+    """参数字典 -> 单位超立方体中的点，供代理模型使用"""
+    u = []
+    for name, spec in space.items():
+        kind, value = spec[0], params[name]
+        if kind == "choice":
+            u.append((spec[1].index(value) + 0.5) / len(spec[1]))
+        elif kind == "log":
+            u.append((math.log(value) - math.log(spec[1])) / (math.log(spec[2]) - math.log(spec[1])))
+        else:
+            u.append((value - spec[1]) / (spec[2] - spec[1]))
+    return u
+
+
+def _evaluate_trial(task):
+    """返回 (平均 PCC, 错误信息)；只有参数校验错误(ValueError)视为不合法的参数组合，其他异常照常抛出"""
+    # 工作进程内各试验复用同一映射
+    X = attach(task["geno"])
+    try:
+        y = task["y"]
+        if task["model"] in BOOST_MODELS:
+            # 先用全部样本构建量化数据集，各折、各预算的训练子集都从中切取
+            boost_dataset(task["model"], X, y, n_jobs=task["threads"])
+        scores = []
+        for train_idx, val_idx in task["folds"]:
+            # 部分预算：只用训练折的前一部分样本（折内已打乱，预算递增时样本集嵌套）
+            n_use = max(int(len(train_idx) * task["budget"]), min(len(train_idx), 20))
+            train_idx = train_idx[:n_use]
+            model_instance = create_model(task["model"], task["threads"], task["use_gpu"])
+            model_instance.set_params(**task["params"])
+            model_instance.fit(as_work(X[train_idx]), y[train_idx])
+            pred = model_instance.predict(as_work(X[val_idx]))
+            score = np.corrcoef(y[val_idx], pred)[0, 1]
+            scores.append(score if np.isfinite(score) else -1.0)
+        return float(np.mean(scores)), None
+    except ValueError as e:
+        # 不合法的参数组合直接淘汰，错误信息记入试验记录
+        return -1.0, str(e)
+
+
+class HyperparameterSearch:
+    """超参数优化：网格搜索 / 随机搜索 / 基于代理模型的贝叶斯优化
+
+    所有候选配置都经过逐次减半(successive halving)：先在少量样本上评估，
+    只保留前 1/eta 的配置进入下一档预算，最终只有少数配置用全部样本拟合。
+    每一档内的试验在进程池中并行，基因型矩阵通过共享内存传递。
+    评分为训练集内部 cv 折交叉验证的平均 PCC。
+    """
+
+    def __init__(self, model, method="random", n_trials=27, grid_points=3, eta=3, min_budget=1 / 9, cv=3,
+                 threads=1, use_gpu=False, random_state=0, progress=None):
+        self.model = MODEL_ALIASES.get(model, model)
+        self.method = method
+        self.n_trials = n_trials
+        self.grid_points = grid_points
+        self.eta = eta
+        self.min_budget = min_budget
+        self.cv = cv
+        self.threads = threads
+        self.use_gpu = use_gpu
+        self.random_state = random_state
+        self.progress = progress
+
+    def fit(self, X, y):
+        self.space_ = SEARCH_SPACES.get(self.model, {})
+        self.trials_ = []
+        self.best_params_, self.best_score_ = {}, None
+        if not self.space_:
+            return self
+
+        y = np.asarray(y, dtype=np.float64)
+        self._rng = np.random.default_rng(self.random_state)
+        n_rungs = 1 + max(0, int(round(math.log(1 / self.min_budget, self.eta))))
+        self._budgets = [self.eta ** (i - n_rungs + 1) for i in range(n_rungs)]
+        folds = [(self._rng.permutation(train_idx), val_idx) for train_idx, val_idx in
+                 KFold(n_splits=self.cv, shuffle=True, random_state=self.random_state).split(y)]
+
+        n_workers = max(1, min(self.threads, os.cpu_count() or 1))
+        trial_threads = max(1, self.threads // n_workers)
+        with SharedArray(as_work(X)) as shared:
+            self._task = {"geno": shared.desc, "y": y, "folds": folds, "model": self.model,
+                          "threads": trial_threads, "use_gpu": self.use_gpu}
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=limit_threads,
+                                     initargs=(trial_threads,)) as executor:
+                self._executor = executor
+                if self.method == "grid":
+                    # 每维格点数随维度调整，使网格总规模与 n_trials 相当
+                    names = list(self.space_)
+                    points = max(self.grid_points, int(round(self.n_trials ** (1 / len(names)))))
+                    grid = itertools.product(*(_grid_values(self.space_[n], points) for n in names))
+                    self._successive_halving([dict(zip(names, values)) for values in grid])
+                elif self.method == "bayes":
+                    configs_per_round = self.eta ** (n_rungs - 1)
+                    for _ in range(max(1, self.n_trials // configs_per_round)):
+                        self._successive_halving(self._propose(configs_per_round))
+                else:
+                    self._successive_halving([_decode(self.space_, self._rng.random(len(self.space_)))
+                                              for _ in range(self.n_trials)])
+        self._executor = None
+
+        final = [t for t in self.trials_ if t["budget"] == 1 and t["error"] is None]
+        if not final:
+            errors = sorted({t["error"] for t in self.trials_ if t["error"] is not None})
+            raise ValueError(f"所有超参数组合均评估失败: {'; '.join(errors[:3])}")
+        best = max(final, key=lambda t: t["score"])
+        self.best_params_, self.best_score_ = best["params"], best["score"]
+        return self
+
+    def _successive_halving(self, configs):
+        for rung, budget in enumerate(self._budgets):
+            tasks = [dict(self._task, params=params, budget=budget) for params in configs]
+            results = list(self._executor.map(_evaluate_trial, tasks))
+            scores = [score for score, _ in results]
+            for params, (score, error) in zip(configs, results):
+                self.trials_.append({"params": params, "budget": budget, "score": score, "error": error})
+            if self.progress is not None:
+                self.progress(f"超参数优化：预算 {budget:.2f} 评估 {len(configs)} 组参数，"
+                              f"当前最优 PCC={max(scores):.4f}")
+            if rung < len(self._budgets) - 1:
+                keep = max(1, len(configs) // self.eta)
+                configs = [configs[i] for i in np.argsort(scores)[::-1][:keep]]
+
+    def _propose(self, n_configs):
+        """基于高斯过程代理模型和期望提升(EI)提出下一批候选配置，观测不足时随机采样"""
+        d = len(self.space_)
+        for budget in reversed(self._budgets):
+            observed = [t for t in self.trials_ if t["budget"] == budget and t["error"] is None]
+            if len(observed) >= d + 2:
+                break
+        else:
+            return [_decode(self.space_, self._rng.random(d)) for _ in range(n_configs)]
+
+        U = np.array([_encode(self.space_, t["params"]) for t in observed])
+        scores = np.array([t["score"] for t in observed])
+        gp = GaussianProcessRegressor(kernel=Matern(nu=2.5) + WhiteKernel(), normalize_y=True,
+                                      random_state=self.random_state)
+        gp.fit(U, scores)
+
+        candidates = self._rng.random((max(500, 50 * n_configs), d))
+        mean, std = gp.predict(candidates, return_std=True)
+        std = np.maximum(std, 1e-9)
+        z = (mean - scores.max()) / std
+        ei = (mean - scores.max()) * norm.cdf(z) + std * norm.pdf(z)
+
+        proposals, seen = [], set()
+        for i in np.argsort(ei)[::-1]:
+            params = _decode(self.space_, candidates[i])
+            key = json.dumps(params, sort_keys=True)
+            if key not in seen:
+                seen.add(key)
+                proposals.append(params)
+            if len(proposals) == n_configs:
+                break
+        return proposals
+
+
+def save_tuning_result(search, save_dir):
+    try:
+        os.makedirs(save_dir, exist_ok=True)
+        with open(os.path.join(save_dir, "best_params.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": search.model, "method": search.method, "best_params": search.best_params_,
+                       "best_score": search.best_score_}, f, ensure_ascii=False, indent=2)
+        trials = pd.DataFrame([dict(t["params"], budget=t["budget"], score=t["score"], error=t["error"]) for t in search.trials_])
+        trials.to_csv(os.path.join(save_dir, "tuning_trials.csv"), index=False)
+        print(f"成功保存超参数优化结果至：{os.path.abspath(save_dir)}")
+        return True
+    except Exception as e:
+        print(f"保存超参数优化结果失败：{str(e)}")
+        return False
@@ -1,11 +1,12 @@
 import pandas as pd
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIcon
-from PyQt6.QtWidgets import QPushButton, QLabel, QComboBox, QSpinBox, QMessageBox, QFormLayout
+from PyQt6.QtWidgets import QPushButton, QLabel, QComboBox, QSpinBox, QMessageBox, QFormLayout, QCheckBox
 from PyQt6.QtWidgets import QVBoxLayout, QGroupBox, QHBoxLayout
 
 from common_tab import CommonTab, DraggableLineEdit
 from gs import parse_json_from_file
+from gs_curated import find_curated_bundle
 from gs_operations import GSOperations
 
 
@@ -21,9 +22,25 @@ class GSWithDataTab(CommonTab):
         if not self.result_file_path_edit.text().strip():
             QMessageBox.critical(self, "错误", "请选择结果文件保存路径！")
             return
-        if not self.trait_combo.currentText():
+        if not self.multi_trait_check.isChecked() and not self.trait_combo.currentText():
             QMessageBox.critical(self, "错误", "请选择性状！")
             return
+        bundle_file = None
+        if not self.multi_trait_check.isChecked() and self.get_benchmark_models() is None:
+            bundle_file = find_curated_bundle(self.population, self.trait_combo.currentText(),
+                                              self.model_combo.currentText())
+        if bundle_file is not None:
+            if not self.training_file_path_edit.text().strip():
+                QMessageBox.critical(self, "错误", "请选择预测基因型文件！")
+                return
+            self.log_view.append(f"使用预构建模型: {bundle_file}")
+            self.start_worker({
+                "model_bundle": bundle_file,
+                "train_file": self.training_file_path_edit.text().strip(),
+                "result_dir": self.result_file_path_edit.text().strip(),
+            })
+            return
+
         gs_args = {
             "pheno_file": self.pheno_file,
             "geno_file": self.geno_file,
@@ -35,8 +52,17 @@ class GSWithDataTab(CommonTab):
             "threads": self.threads_spin.value(),
             "use_gpu": self.gpu_combo.currentText() == "启用",
             "optimization": self.optimization_combo.currentText(),
+            "impute": self.impute_combo.currentText(),
+            "multi_trait": self.multi_trait_check.isChecked(),
+            "out_of_core": self.out_of_core_check.isChecked(),
+            "cv_folds": self.cv_folds_spin.value(),
+            "cv_repeats": self.cv_repeats_spin.value(),
+            "benchmark_models": self.get_benchmark_models(),
         }
         self.log_view.append("开始 GS 分析...")
+        self.start_worker(gs_args)
+
+    def start_worker(self, gs_args):
         self.worker = GSOperations(gs_args)
         self.worker.progress_signal.connect(self.upload_message)
         self.worker.operation_complete.connect(self.show_operation_dialog)
@@ -117,6 +143,7 @@ class GSWithDataTab(CommonTab):
                         paper_link = f"<a href='{population['url']}' style='text-decoration: none;'>{population['paper']}</a>"
                         self.paper_info_label.setText(f"{paper_link}")
                         self.paper_info_label.setOpenExternalLinks(True)
+                        self.population = population
                         self.pheno_file = population["phe"]
                         self.geno_file = population["geno"]
                         self.load_traits(self.pheno_file)
@@ -154,11 +181,21 @@ class GSWithDataTab(CommonTab):
         self.trait_combo.setPlaceholderText("请选择性状")
         gs_param_layout.addRow(QLabel("选择性状:"), self.trait_combo)
 
+        # 多性状联合分析
+        self.multi_trait_check = QCheckBox("全部性状联合分析（仅 GBLUP/rrBLUP/KRR/RKHS）")
+        self.multi_trait_check.toggled.connect(lambda checked: self.trait_combo.setEnabled(not checked))
+        gs_param_layout.addRow(QLabel("多性状模式:"), self.multi_trait_check)
+
+        # 外存模式：基因型保留在磁盘上，按标记块计算
+        self.out_of_core_check = QCheckBox("基因型不载入内存，按标记块计算（仅 GBLUP/rrBLUP，超大标记集）")
+        gs_param_layout.addRow(QLabel("外存模式:"), self.out_of_core_check)
+
         # 模型分类
         self.model_categories = {
             "BLUP": ["GBLUP", "rrBLUP(Ridge)"],
             "机器学习": ["SVR", "RF", "CatBoost", "XGBoost", "LightGBM", "GBDT"],
-            "贝叶斯方法": ["BayesA"],
+            "核方法": ["KRR", "RKHS"],
+            "贝叶斯方法": ["BayesA", "BayesB", "BayesCπ"],
             "正则化方法": ["LASSO", "ElasticNet"]
         }
 
@@ -173,6 +210,11 @@ class GSWithDataTab(CommonTab):
         gs_param_layout.addRow(QLabel("具体模型:"), self.model_combo)
         self.update_model_combo(self.category_combo.currentText())
 
+        # 运行模式：单模型或多模型对比
+        self.run_mode_combo = QComboBox()
+        self.run_mode_combo.addItems(["单模型", "当前类别全部模型对比", "全部模型对比"])
+        gs_param_layout.addRow(QLabel("运行模式:"), self.run_mode_combo)
+
         # 线程数
         self.threads_spin = QSpinBox()
         self.threads_spin.setRange(1, 16)
@@ -186,9 +228,24 @@ class GSWithDataTab(CommonTab):
 
         # 优化算法
         self.optimization_combo = QComboBox()
-        self.optimization_combo.addItems(["网格搜索", "随机搜索", "贝叶斯优化"])
+        self.optimization_combo.addItems(["不优化", "网格搜索", "随机搜索", "贝叶斯优化"])
         gs_param_layout.addRow(QLabel("优化算法:"), self.optimization_combo)
 
+        self.impute_combo = QComboBox()
+        self.impute_combo.addItems(["均值填充", "众数填充", "kNN 填充"])
+        gs_param_layout.addRow(QLabel("缺失基因型填充:"), self.impute_combo)
+
+        # 交叉验证（折数为 0 时使用单次 6:4 划分）
+        self.cv_folds_spin = QSpinBox()
+        self.cv_folds_spin.setRange(0, 10)
+        self.cv_folds_spin.setValue(5)
+        gs_param_layout.addRow(QLabel("交叉验证折数:"), self.cv_folds_spin)
+
+        self.cv_repeats_spin = QSpinBox()
+        self.cv_repeats_spin.setRange(1, 10)
+        self.cv_repeats_spin.setValue(1)
+        gs_param_layout.addRow(QLabel("交叉验证重复次数:"), self.cv_repeats_spin)
+
         # 执行按钮
         self.btn_run_gs = QPushButton("执行基因型选择")
         self.btn_run_gs.setIcon(QIcon("../icons/run.svg"))
@@ -198,6 +255,14 @@ class GSWithDataTab(CommonTab):
         gs_param_group.setLayout(gs_param_layout)
         return gs_param_group
 
+    def get_benchmark_models(self):
+        mode = self.run_mode_combo.currentText()
+        if mode == "当前类别全部模型对比":
+            return self.model_categories.get(self.category_combo.currentText(), [])
+        if mode == "全部模型对比":
+            return [m for models in self.model_categories.values() for m in models]
+        return None
+
     def update_model_combo(self, category):
         current_models = self.model_categories.get(category, [])
         self.model_combo.clear()
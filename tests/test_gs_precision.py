@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.kernel_ridge import KernelRidge
+from sklearn.linear_model import Ridge
+from sklearn.svm import SVR
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from gs_blup import GBLUPModel, RRBLUPModel  # noqa: E402
+from gs_kernels import KernelModel  # noqa: E402
+from gs_precision import BLOCK_SIZE, as_work, blocked_products  # noqa: E402
+
+
+def _data():
+    """均值填充后的剂量（含小数，float32 计算不再精确），标记数跨越多个标记块"""
+    rng = np.random.default_rng(0)
+    n_samples, n_markers = 260, BLOCK_SIZE + 904
+    X = rng.integers(0, 3, (n_samples, n_markers)).astype(np.float64)
+    missing = rng.random(X.shape) < 0.05
+    X[missing] = np.nan
+    X = np.where(missing, np.nanmean(X, axis=0), X)
+    y = X[:, :200].sum(axis=1) * 0.05 + rng.normal(size=n_samples)
+    return X[:200], y[:200], X[200:]
+
+
+def _assert_close(actual, expected, rel):
+    """相对于参考值量级的最大绝对误差"""
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=rel * np.abs(expected).max())
+
+
+def test_gblup_float32_matches_float64():
+    X, y, X_new = _data()
+    mean, scale = X.mean(axis=0), X.std(axis=0)
+    Z, Z_new = (X - mean) / scale, (X_new - mean) / scale
+    G = np.dot(Z, Z.T) / X.shape[1]
+    G_cross = np.dot(Z_new, Z.T) / X.shape[1]
+
+    _assert_close(blocked_products(as_work(Z), as_work(Z)) / X.shape[1], G, 1e-6)
+    expected = GBLUPModel(kernel="precomputed").fit(G, y).predict(G_cross)
+    _assert_close(GBLUPModel().fit(X, y).predict(X_new), expected, 1e-5)
+
+
+def test_rrblup_coef_float32_matches_float64():
+    X, y, X_new = _data()
+    model = RRBLUPModel().fit(X, y)
+    expected = Ridge(alpha=model.alpha_).fit(X, y)
+    _assert_close(model.coef_, expected.coef_, 1e-5)
+    _assert_close(model.predict(X_new), expected.predict(X_new), 1e-5)
+
+
+@pytest.mark.parametrize("kernel", ["linear", "rbf", "poly"])
+def test_precomputed_krr_float32_matches_float64(kernel):
+    X, y, X_new = _data()
+    gamma = 1.0 / X.shape[1]
+    expected = KernelRidge(alpha=0.1, kernel=kernel, gamma=gamma, degree=2, coef0=1.0).fit(X, y).predict(X_new)
+    _assert_close(KernelModel("KRR", kernel=kernel).fit(X, y).predict(X_new), expected, 1e-5)
+
+
+def test_precomputed_svr_float32_matches_float64():
+    X, y, X_new = _data()
+    expected = SVR(kernel="rbf", gamma=1.0 / X.shape[1], C=100.0, epsilon=0.1).fit(X, y).predict(X_new)
+    # libsvm 的停止容差为 1e-3
+    _assert_close(KernelModel("SVR", kernel="rbf").fit(X, y).predict(X_new), expected, 1e-3)